@@ -1,12 +1,39 @@
+import sys
+from time import perf_counter_ns
+
+# (phase, time it ended), printed at the first frame with 'python -m vizier --startup-profile'
+startup = [('start', perf_counter_ns())]
+
+def startup_phase(name):
+    startup.append((name, perf_counter_ns()))
+
+def startup_report():
+    startup_phase('first frame')
+    print(f'{"phase":<20} {"ms":>8} {"total ms":>9}')
+    for (_, previous), (name, end) in zip(startup, startup[1:]):
+        print(f'{name:<20} {(end - previous) / 1e6:>8.1f} {(end - startup[0][1]) / 1e6:>9.1f}')
+
+import logging
 import dearpygui.dearpygui as dpg
-import yaml
+startup_phase('import dearpygui')
+
+# 'python -m vizier bench' runs the benchmarks instead of the application
+if sys.argv[1:2] == ['bench']:
+    from .modules import benchmark
+    benchmark.main(sys.argv[2:])
+    sys.exit()
+
 from .modules import helpers
 from .modules import launcher
 from .modules import theme
 from .modules import profile
 from .modules import settings
+from .modules import tracing
+from .modules import configuration
+from .modules import jobs
 from .modules.profile_datamodel import ActiveProfile
 from .modules.theme import COLORS
+startup_phase('import modules')
 
 dpg.create_context()
 
@@ -14,8 +41,15 @@ dpg.create_context()
 fixed_window = {'no_title_bar': True, 'menubar': False, 'no_resize': True, 'no_move': True}
 __version__ = 'Vizier 0.2.0'
 
-with open('vizier/config/config.yaml') as config_file:
-        config = yaml.safe_load(config_file)
+config = configuration.application()
+
+# DEBUG, INFO, WARNING or ERROR
+logging.basicConfig(format='%(levelname)s:%(message)s', level=config.log_level)
+
+# with 'trace' on, spans are written to trace_path as Chrome trace JSON when the application quits
+if config.trace:
+    tracing.enable()
+startup_phase('context and config')
 
 def keypress(sender, app_data):
     # TODO move this to helpers
@@ -39,6 +73,7 @@ with dpg.value_registry(tag='value_main'):
     dpg.add_string_value(default_value=0, tag='str_time_remaining')
     dpg.add_bool_value(default_value=True, tag='bool_debug')
     dpg.add_string_value(default_value="No active profile.", tag='txt_activeprofile')
+    dpg.add_string_value(default_value='', tag='txt_prefetch_stats')
 
 # keypress handler for general use
 with dpg.handler_registry():
@@ -65,7 +100,7 @@ with dpg.window(tag='primary_window'):
                 dpg.add_table_cell()
                 dpg.add_button(tag='btn_calibrate', label='Calibrate', callback=settings.calibrate, width=200)
 
-            if config['application']['debug'] == True:
+            if config.debug:
                 with dpg.table_row():
                     dpg.add_table_cell()
                     dpg.add_button(tag='btn_style_editor', label='Style editor', callback=dpg.show_style_editor, width=200)
@@ -87,13 +122,29 @@ with dpg.window(tag='primary_window'):
             dpg.add_table_column(width=25, width_stretch=True)
 
 # add debug window (show/hide quake-style with ~)
-if config['application']['debug'] == True:
+if config.debug:
     with dpg.window(tag='win_debug', pos=[200, 500], width=600, height=300, **fixed_window):
         dpg.add_checkbox(tag='check_debug', source='bool_debug', label='Show debugging info')
-        dpg.add_text(source='txt_debug', wrap=280)
+        dpg.add_text(source='txt_prefetch_stats')
+        with dpg.plot(label='System latency (ms)', height=150, width=-1):
+            dpg.add_plot_axis(dpg.mvXAxis, label='ms')
+            with dpg.plot_axis(dpg.mvYAxis, label='answers'):
+                dpg.add_histogram_series([], bins=30, tag='hist_system_latency')
+        dpg.add_text(source='txt_debug', wrap=280, tag='text_debug')
+    # the debug text is updated once per frame while it is visible
+    with dpg.item_handler_registry(tag='handlers_debug'):
+        dpg.add_item_visible_handler(callback=helpers.debug_log.refresh)
+    dpg.bind_item_handler_registry('text_debug', 'handlers_debug')
 
+startup_phase('windows')
 theme.initialize()
+startup_phase('theme')
+# sets up the database and keeps answers streamed by sessions that did not end, in the background
+helpers.scheduler.call_later(0, profile.recover_orphaned_sessions, background=True)
 
+# callbacks, timers and jobs all run on the render thread, see the jobs module
+dpg.configure_app(manual_callback_management=True)
+helpers.scheduler.dispatch = jobs.runner.post
 
 # DPG context etc
 dpg.create_viewport(title='Vizier', width=1000, height=700)
@@ -103,5 +154,11 @@ dpg.show_viewport()
 dpg.set_viewport_vsync(True)
 dpg.set_primary_window("primary_window", True)
 dpg.maximize_viewport()
-dpg.start_dearpygui()
+startup_phase('viewport')
+if '--startup-profile' in sys.argv[1:]:
+    dpg.set_frame_callback(1, startup_report)
+jobs.runner.loop(config.job_budget_ms)
+profile.writer.flush()  # results of a session ended just before quitting
+if tracing.enabled:
+    tracing.export(config.trace_path)
 dpg.destroy_context()
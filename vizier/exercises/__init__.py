@@ -1,6 +1,17 @@
 # __init__.py
+"""Exercise plugins. A plugin is a module with a run(config) function, imported the
+first time one of its configurations is launched."""
 
-from . import vergence
-from . import alignment
-from . import depth_perception
-from . import recognition
+import importlib
+
+# 'Plugin:' names used in exercise_configs.yaml and the modules implementing them
+PLUGINS = {
+    'vergence': 'vergence',
+    'recognition': 'recognition',
+    'depth_perception': 'depth_perception',
+    'alignment': 'alignment',
+}
+
+def load(plugin):
+    """Returns the module of a plugin, importing it on first use."""
+    return importlib.import_module(f'.{PLUGINS[plugin]}', __name__)
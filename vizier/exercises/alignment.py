@@ -2,21 +2,26 @@ import numpy as np
 import dearpygui.dearpygui as dpg
 from collections import namedtuple
 from ..modules import helpers
+from ..modules import drawing
+from ..modules import tracing
+from ..modules.theme import COLORS
 
 class Alignment():
-    def __init__(self, drawlist, **kwargs):
+    def __init__(self, drawlist, backend=None, **kwargs):
+        self.backend = backend or drawing.active
         self.drawlist_uuid = drawlist
         self.object_rel_size = kwargs.get('object_size', 4)
-        self.drawlist_width = dpg.get_item_width(self.drawlist_uuid)
-        self.drawlist_height = dpg.get_item_height(self.drawlist_uuid)
+        self.drawlist_width = self.backend.get_item_width(self.drawlist_uuid)
+        self.drawlist_height = self.backend.get_item_height(self.drawlist_uuid)
         self.object_size = self.object_rel_size / 100 * self.drawlist_width
         self.position_randomness = kwargs.get('randomness', 0)
 
+    @tracing.traced()
     def draw(self):
         # draw a target in a random place near the center of the screen
         # draw a crosshair in a random place
         # return the uuid of the node and the coords of the target
-        draw_node_uuid = dpg.generate_uuid()
+        draw_node_uuid = self.backend.generate_uuid()
         x_center = self.drawlist_width / 2
         y_center = self.drawlist_height / 2
         x_min = x_center - self.object_size
@@ -35,41 +40,36 @@ class Alignment():
             s = self.object_size
             return x, y, s
 
-        with dpg.draw_node(tag=draw_node_uuid, parent=self.drawlist_uuid):
-            with dpg.draw_node(tag='target'):
-                x, y, s = random_coords()
-                dpg.draw_rectangle((x, y), (x + self.object_size, y + self.object_size), color=COLORS['blue'], thickness=2)
+        self.backend.draw_node(parent=self.drawlist_uuid, tag=draw_node_uuid)
+        node_target_uuid = self.backend.draw_node(parent=draw_node_uuid)
+        x, y, s = random_coords()
+        self.backend.draw_rectangle((x, y), (x + self.object_size, y + self.object_size), parent=node_target_uuid, color=COLORS['blue'], thickness=2)
 
-            node_aim_uuid = dpg.generate_uuid()
-            with dpg.draw_node(tag=node_aim_uuid):
-                x, y, s = random_coords()
-                # how to draw a quad?
-                # p1 (left): x, y+s/2       # p2 (down): x+s/2, y+s
-                # p3 (right): x+s, y+s/2    # p4 (up): x+s/2, y
-                dpg.draw_quad((x, y+s/2), ((x+s/2), (y+s)), (x+s, y+s/2), (x+s/2, y), color=COLORS['red'], thickness=2)
+        # the aim is drawn once and moved by the player with transforms, see drawing.Node
+        aim = drawing.Node(draw_node_uuid, backend=self.backend)
+        x, y, s = random_coords()
+        # how to draw a quad?
+        # p1 (left): x, y+s/2       # p2 (down): x+s/2, y+s
+        # p3 (right): x+s, y+s/2    # p4 (up): x+s/2, y
+        self.backend.draw_quad((x, y+s/2), ((x+s/2), (y+s)), (x+s, y+s/2), (x+s/2, y), parent=aim.tag, color=COLORS['red'], thickness=2)
 
         # return a namedtuple for legibility in other places
         # TODO switch to dataclass
-        drawing = namedtuple('Drawing', ['node_uuid', 'node_aim_uuid'])
-        return drawing(draw_node_uuid, node_aim_uuid)
+        Drawing = namedtuple('Drawing', ['node_uuid', 'aim'])
+        return Drawing(draw_node_uuid, aim)
 
 def run(config):
+    @tracing.traced_callback('alignment.evaluate')
     def evaluate(sender, app_data):
         key = helpers.translate_key(app_data)
-        movement_keys = ['left', 'right', 'up', 'down']
-        if key in movement_keys:
-            # translate the target node
-            node_aim = queue.current_item.node_aim_uuid
-            node_aim_pos = dpg.get_item_pos(node_aim)
-            if key == 'left':
-                node_aim_pos[0] -= 1
-            dpg.set_item_pos(queue.current_item.node_aim_uuid, node_aim_pos)
-            # dpg.set_item_pos(queue.current_item.node_aim_uuid, pos=newpos)
-            # dpg.set_item_configuration(queue.curent_item.node_aim_uuid, pos=newpos)
+        movements = {'left': (-1, 0), 'right': (1, 0), 'up': (0, -1), 'down': (0, 1)}
+        if key in movements:
+            # translate the aim node
+            queue.current_item.aim.move_by(*movements[key])
 
     # set up basic configs and objects
-    session_config = config.get('Session')  # this config part is required
-    exercise_config = config.get('Exercise', None) # this config part is optional
+    session_config = config.session  # this config part is required
+    exercise_config = config.exercise_params # this config part is optional
     session = helpers.EvaluationSession(**session_config)
     queue = helpers.DrawQueue()
     viewp_h, viewp_w = dpg.get_viewport_height(), dpg.get_viewport_width()
@@ -2,21 +2,25 @@ import dearpygui.dearpygui as dpg
 import numpy as np
 from collections import namedtuple
 from ..modules import helpers
+from ..modules import drawing
+from ..modules import tracing
 from ..modules import imagemap
-from time import sleep
+from ..modules import atlas
+from time import perf_counter_ns
 
 """
 Depth perception exercise.
 """
 
 class DepthPerception():
-    def __init__(self, drawlist, **kwargs):
+    def __init__(self, drawlist, backend=None, **kwargs):
+        self.backend = backend or drawing.active
         self.object_type = kwargs.get('object_type', 'circle')
         self.object_count = kwargs.get('object_count', 3)
         self.object_rel_size = kwargs.get('object_size', 5)
         self.drawlist_uuid = drawlist
-        self.drawlist_width = dpg.get_item_width(self.drawlist_uuid)
-        self.drawlist_height = dpg.get_item_height(self.drawlist_uuid)
+        self.drawlist_width = self.backend.get_item_width(self.drawlist_uuid)
+        self.drawlist_height = self.backend.get_item_height(self.drawlist_uuid)
         self.object_size = self.object_rel_size / 100 * self.drawlist_width
         self.object_margin = self.object_size * 0.20
         self.arrow_size = (50, 50)
@@ -24,12 +28,16 @@ class DepthPerception():
         self.max_depth = kwargs.get('max_depth', 10) / 100 * self.object_size
         self.min_depth_diff = kwargs.get('min_depth_diff', 5)
         self.max_depth_diff = kwargs.get('max_depth_diff', 15)
+        self.display_delay_secs = kwargs.get('display_delay_secs', 0.2)
+        self.arrow = None
 
+    @tracing.traced()
     def draw(self) -> tuple:
-        """Draw sequence of anaglyph objects in hidden state. One of the objects has a different anaglyph_offset. Return drawnode uuid."""
+        """Draw sequence of anaglyph objects, each in its own hidden node. One of the objects has a different anaglyph_offset.
+        Return drawnode uuid and a timeline to reveal the objects one by one, display_delay_secs apart."""
         x_min = (self.drawlist_width / 2) - (self.object_count * (self.object_size + self.object_margin) / 2)
         y = (self.drawlist_height / 2) - (self.object_size / 2)
-        node_uuid = str(dpg.generate_uuid())
+        node_uuid = str(self.backend.generate_uuid())
         offset = np.random.randint(self.min_depth, self.max_depth)
         special_object = np.random.randint(self.object_count)
         special_offset = np.random.randint(self.min_depth_diff, self.max_depth_diff)
@@ -39,46 +47,54 @@ class DepthPerception():
         if plus == False:
             special_offset = offset - special_offset
 
-        with dpg.draw_node(tag=node_uuid, parent=self.drawlist_uuid, show=True):
-            for i in range(self.object_count):
-                sleep(0.2)
-                if i == special_object:
-                    x_offset = special_offset
-                else:
-                    x_offset = offset
-                x = x_min + i * (self.object_size + self.object_margin)
-                dpg.draw_circle(
+        timeline = []
+
+        self.backend.draw_node(parent=self.drawlist_uuid, tag=node_uuid, show=True)
+        for i in range(self.object_count):
+            object_node = self.backend.draw_node(parent=node_uuid, show=False)
+            timeline.append(((i + 1) * self.display_delay_secs, object_node))
+            if i == special_object:
+                x_offset = special_offset
+            else:
+                x_offset = offset
+            x = x_min + i * (self.object_size + self.object_margin)
+            self.backend.draw_circle(
                 [x - x_offset / 2, y],
                 self.object_size / 2,
-                color = dpg.get_value('color_left'),
+                parent = object_node,
+                color = self.backend.get_value('color_left'),
+                thickness = 5
+            )
+            self.backend.draw_circle(
+                [x + x_offset / 2, y],
+                self.object_size / 2,
+                parent = object_node,
+                color = self.backend.get_value('color_right'),
                 thickness = 5
-                )
-                dpg.draw_circle(
-                    [x + x_offset / 2, y],
-                    self.object_size / 2,
-                    color = dpg.get_value('color_right'),
-                    thickness = 5
-                )
-            self.draw_arrow(0)
+            )
+        self.draw_arrow(0)
         
          # return a namedtuple for legibility in other places
-        drawing = namedtuple('Drawing', ['node_uuid', 'special_object'])
-        return drawing(node_uuid, special_object)
+        drawing = namedtuple('Drawing', ['node_uuid', 'special_object', 'timeline'])
+        return drawing(node_uuid, special_object, timeline)
 
     def draw_arrow(self, position):
-        if dpg.does_item_exist('answer_arrow'):
-            dpg.delete_item('answer_arrow')
-        x_min = (self.drawlist_width / 2) - (self.object_count * (self.object_size + self.object_margin) / 2)
-        x = x_min + position * (self.object_size + self.object_margin) - self.arrow_size[0] / 2
-        y = (self.drawlist_height / 2) + (self.object_size / 2)
-
-        with dpg.draw_node(tag='answer_arrow', parent=self.drawlist_uuid, show=True):
-            dpg.draw_image(imagemap.arrows.get('up'), pmin=(x, y), pmax=(x + self.arrow_size[0], y + self.arrow_size[1]))
+        """Points the answer arrow at the object at position. The arrow is drawn once and then moved."""
+        step = self.object_size + self.object_margin
+        if self.arrow is None or not self.backend.does_item_exist(self.arrow.tag):
+            x_min = (self.drawlist_width / 2) - (self.object_count * step / 2)
+            x = x_min - self.arrow_size[0] / 2
+            y = (self.drawlist_height / 2) + (self.object_size / 2)
+            self.arrow = drawing.Node(self.drawlist_uuid, backend=self.backend)
+            atlas.draw(imagemap.arrows.get('up'), pmin=(x, y), pmax=(x + self.arrow_size[0], y + self.arrow_size[1]), parent=self.arrow.tag, backend=self.backend)
+        self.arrow.move_to(position * step, 0)
 
 def run(config) -> None:
     """Depth perception evaluation."""
 
+    @tracing.traced_callback('depth_perception.evaluate')
     def evaluate(sender, app_data):
+        key_ns = perf_counter_ns()
         key = helpers.translate_key(app_data)
         if key == 'left':
             if answers.answers[0] > 0:
@@ -89,10 +105,8 @@ def run(config) -> None:
         exercise.draw_arrow(answers.answers[0])
         
         if key == 'return':
-            if answers.answers[0] == queue.current_item.special_object:
-                session.add_result(True)
-            else:
-                session.add_result(False)
+            result = bool(answers.answers[0] == queue.current_item.special_object)
+            session.add_result(result, shown_ns=queue.shown_ns, key_ns=key_ns)
             if session.active:
                 queue.remove()
                 answers.replace(0)
@@ -100,10 +114,11 @@ def run(config) -> None:
                 queue.add(exercise.draw())
                 helpers.debugger(f'Next.')
                 queue.next()
+                session.complete_result()
 
   # set up basic configs and objects
-    session_config = config.get('Session')  # this config part is required
-    exercise_config = config.get('Exercise', None) # this config part is optional
+    session_config = config.session  # this config part is required
+    exercise_config = config.exercise_params # this config part is optional
     session = helpers.EvaluationSession(**session_config)
     queue = helpers.DrawQueue()
     answers = helpers.Answers()
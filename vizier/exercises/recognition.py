@@ -1,9 +1,12 @@
 import numpy as np
 import dearpygui.dearpygui as dpg
 from collections import namedtuple
-from time import sleep
+from time import perf_counter_ns
 from ..modules import helpers
+from ..modules import drawing
+from ..modules import tracing
 from ..modules import imagemap
+from ..modules import atlas
 
 class Recognition():
     """Game where subject sees a number of objects and has to reproduce them
@@ -15,48 +18,55 @@ class Recognition():
     :param display_delay_secs: delay between drawing each object in secs
     :param display_time_secs
     :param drawlist_uuid: uuid of the drawlist to draw on
+    :param backend: the drawing backend, defaults to drawing.active
     """
-    def __init__(self, drawlist, **kwargs):
+    def __init__(self, drawlist, backend=None, **kwargs):
+        self.backend = backend or drawing.active
         self.object_type = kwargs.get('object_type', 'arrow')
         self.object_count = kwargs.get('object_count', 3)
         self.object_rel_size = kwargs.get('object_size', 5)
         self.display_delay_secs = kwargs.get('display_delay_secs', 0.3)
         self.display_time_secs = kwargs.get('display_time_secs', 0.7)
         self.drawlist_uuid = drawlist
-        self.drawlist_width = dpg.get_item_width(self.drawlist_uuid)
-        self.drawlist_height = dpg.get_item_height(self.drawlist_uuid)
-        self.answers_node_uuid = dpg.generate_uuid()
+        self.drawlist_width = self.backend.get_item_width(self.drawlist_uuid)
+        self.drawlist_height = self.backend.get_item_height(self.drawlist_uuid)
+        self.answers_node_uuid = self.backend.generate_uuid()
         self.object_size = self.object_rel_size / 100 * self.drawlist_width
         self.object_margin = self.object_size * 0.15
         self.rng = np.random.default_rng()
 
+    @tracing.traced()
     def draw(self):
-        """Draw sequence of objects in hidden state. Return drawnode uuid."""
+        """Draw sequence of objects, each in its own hidden node. Return drawnode uuid and
+        a timeline to reveal the objects one by one, display_delay_secs apart."""
         x_min = (self.drawlist_width / 2) - (self.object_count * (self.object_size + self.object_margin) / 2)
         y = (self.drawlist_height / 2) - (self.object_size / 2)
-        node_uuid = str(dpg.generate_uuid())
+        node_uuid = str(self.backend.generate_uuid())
         arrow_direction = self.rng.choice(['top', 'bottom', 'left', 'right'])
         directions = []
+        timeline = []
 
-        with dpg.draw_node(tag=node_uuid, parent=self.drawlist_uuid, show=True):
-            for i in range(self.object_count):
-                random_direction = self.rng.choice(['up', 'down', 'left', 'right'])
-                x = x_min + (i * (self.object_size + self.object_margin))
-                dpg.draw_image(imagemap.arrows.get(random_direction), pmin=(x, y), pmax=(x + self.object_size, y + self.object_size))
-                directions.append(random_direction)
-                sleep(self.display_delay_secs)
+        self.backend.draw_node(parent=self.drawlist_uuid, tag=node_uuid, show=True)
+        for i in range(self.object_count):
+            random_direction = self.rng.choice(['up', 'down', 'left', 'right'])
+            x = x_min + (i * (self.object_size + self.object_margin))
+            object_node = self.backend.draw_node(parent=node_uuid, show=False)
+            atlas.draw(imagemap.arrows.get(random_direction), pmin=(x, y), pmax=(x + self.object_size, y + self.object_size), parent=object_node, backend=self.backend)
+            directions.append(random_direction)
+            timeline.append((i * self.display_delay_secs, object_node))
 
          # return a namedtuple for legibility in other places
-        drawing = namedtuple('Drawing', ['node_uuid', 'directions', 'display_time_secs'])
-        return drawing(node_uuid, directions, self.display_time_secs)
+        drawing = namedtuple('Drawing', ['node_uuid', 'directions', 'display_time_secs', 'timeline'])
+        return drawing(node_uuid, directions, self.display_time_secs, timeline)
 
     def draw_single(self, key, pos):
         image = imagemap.arrows.get(key)
         x_min = (self.drawlist_width / 2) - (self.object_count * (self.object_size + self.object_margin) / 2)
         x = x_min + (pos * (self.object_size + self.object_margin))
         y = (self.drawlist_height / 2) - (self.object_size / 2) + (self.object_size)
-        with dpg.draw_node(tag=self.answers_node_uuid, parent=self.drawlist_uuid):
-            dpg.draw_image(image, pmin=(x, y), pmax=(x + self.object_size, y + self.object_size))
+        if not self.backend.does_item_exist(self.answers_node_uuid):
+            self.backend.draw_node(parent=self.drawlist_uuid, tag=self.answers_node_uuid)
+        atlas.draw(image, pmin=(x, y), pmax=(x + self.object_size, y + self.object_size), parent=self.answers_node_uuid, backend=self.backend)
 
 def run(config):
     """Evaluate performance recognizing and remembering briefly displayed objects.
@@ -69,9 +79,19 @@ def run(config):
     :param duration_secs: duration of the sequence in seconds.
     """
 
+    def next_round():
+        """Draws the next sequence. Cancelled by the scheduler when the session ends during the pause."""
+        dpg.delete_item(recognition.answers_node_uuid)
+        queue.add(recognition.draw())
+        queue.next()
+        answers.accept_input = True # accept input again
+        session.complete_result()
+
+    @tracing.traced_callback('recognition.evaluate')
     def evaluate(sender, app_data, accept_input=True):
         """Keypress callback function containing the evaluation logic.
         Add results to the session object. Add drawnodes to the queue."""
+        key_ns = perf_counter_ns()
         key = helpers.translate_key(app_data)
         possible_answers = ['left', 'right', 'up', 'down']
         if (key in possible_answers) & (answers.accept_input == True):
@@ -82,18 +102,15 @@ def run(config):
             if len(answers.answers) == recognition.object_count:
                 answers.accept_input = False    # dont accept input while evaluating and drawing
                 result = answers.answers == queue.current_item.directions
-                session.add_result(result)
+                session.add_result(result, shown_ns=queue.shown_ns, key_ns=key_ns)
                 answers.reset()
 
                 if session.active:
-                    sleep(2)    # a little pause before the next exercise
-                    dpg.delete_item(recognition.answers_node_uuid)
-                    queue.add(recognition.draw())
-                    queue.next()
-                    answers.accept_input = True # accept input again
-
-    session_config = config.get('Session')  # this config part is required
-    exercise_config = config.get('Exercise', None) # this config part is optional
+                    # a little pause before the next exercise, without blocking the callback thread
+                    helpers.scheduler.call_later(2, next_round, owner=session)
+
+    session_config = config.session  # this config part is required
+    exercise_config = config.exercise_params # this config part is optional
     answers = helpers.Answers()
     session = helpers.EvaluationSession(**session_config)
     queue = helpers.DrawQueue()
@@ -1,7 +1,68 @@
 import dearpygui.dearpygui as dpg
 import numpy as np
 from collections import namedtuple
+from functools import lru_cache
+from time import perf_counter_ns
 from ..modules import helpers
+from ..modules import drawing
+from ..modules import tracing
+from ..modules import jobs
+
+FOCAL_POSITIONS = ("top", "bottom", "left", "right")
+
+# center of the focal point relative to the image, per focal position
+FOCAL_LOCATIONS = {
+    "top": {"x": 0.5, "y": 0.25},
+    "bottom": {"x": 0.5, "y": 0.75},
+    "left": {"x": 0.25, "y": 0.5},
+    "right": {"x": 0.75, "y": 0.5},
+}
+
+@lru_cache(maxsize=64)
+def diamond_mask(pixel_count, focal_pixel_count, focal_position, focal_offset=0):
+    """Returns a read-only boolean array (indexed [x, y]) containing the diamond shaped focal point,
+    shifted focal_offset pixels along the x-axis. Results are cached: there are only a handful of
+    combinations per exercise."""
+    x_min = int(pixel_count * FOCAL_LOCATIONS[focal_position]["x"])
+    y_min = int(pixel_count * FOCAL_LOCATIONS[focal_position]["y"]) - int(focal_pixel_count / 2)
+
+    # step means: how many extra pixels to draw on each subsequent row of the matrix
+    # by incrementing the amount of pixels to draw, a triangle shape is created.
+    # The triangle is followed by itself upside down.
+    step = round(focal_pixel_count / (focal_pixel_count / 2))
+    widths = np.arange(0, focal_pixel_count, step)
+    widths = np.concatenate((widths, widths[::-1]))
+    starts = (x_min - widths / 2).astype(int) + focal_offset  # half of a row is left of center
+
+    # compare every x with the start and end of every row at once
+    x = np.arange(pixel_count)[:, None]
+    mask = np.zeros((pixel_count, pixel_count), dtype=bool)
+    rows = (x >= starts) & (x < starts + widths)
+    # rows outside the image are left out, at the top as well as at the bottom
+    start, end = max(y_min, 0), min(y_min + len(widths), pixel_count)
+    mask[:, start:end] = rows[:, start - y_min:end - y_min]
+    mask.flags.writeable = False
+    return mask
+
+BIT_SHIFTS = np.arange(8, dtype=np.uint8)
+
+# rectangles drawn per chunk of Anaglyph.render_chunks(), see the jobs module
+RECT_CHUNK = 100
+
+# RGBA buffers Anaglyph.refresh() draws into in turn
+DYNAMIC_BUFFERS = ("rgba_front", "rgba_back")
+
+def dots_per_degree(pixel_size, viewing_distance_cm, pixels_per_cm):
+    """Dots of disparity that make one degree of visual angle at the viewing distance."""
+    return viewing_distance_cm * np.tan(np.radians(1)) * pixels_per_cm / pixel_size
+
+def random_bits(rng, out):
+    """Fills a flat uint8 array with random zeros and ones, in place.
+    Draws one 64 bit number per 64 pixels. The length of out must be a multiple of 64."""
+    raw = rng.bit_generator.random_raw(out.size // 64)
+    bits = out.reshape(-1, 8)
+    np.right_shift(raw.view(np.uint8)[:, None], BIT_SHIFTS, out=bits)
+    np.bitwise_and(bits, 1, out=bits)
 
 class Anaglyph:
     """
@@ -9,24 +70,34 @@ class Anaglyph:
     draw() draws both focal point and background in order, according to the kwargs defined in __init__.
 
     :param drawlist: the DPG parent to draw into.
+    :param backend: the drawing backend, defaults to drawing.active.
     :param bg_offset: Define drawing offset on x-axis for the background image.
     :param focal_offset: Define drawing offset on x-axis for the focal image.
     :param size: Size of one side of the image in pixels. Used for x and y size.
     :param pixel_size: Size of the individual squares ('pixels') drawn.
     :param focal_size_rel: Relative size of the focal point as fraction of 1.
+    :param renderer: 'texture' draws both eyes as a single image, 'rectangles' draws every dot separately.
+    :param mode: 'steps' draws every item at its bg_offset. 'smooth' draws each eye into its own
+        node without bg_offset, so shift() can move them apart every frame, see Ramp. 'dynamic'
+        draws new random dots every frame with refresh(), keeping the focal shape, see Refresh.
+        Smooth and dynamic mode always draw textures.
+    :param ramp_deg_per_sec: (smooth) rate at which the disparity changes, in degrees per second.
+    :param viewing_distance_cm: (smooth) distance between the eyes and the screen.
+    :param pixels_per_cm: (smooth) pixel density of the screen.
     """
 
-    def __init__(self, drawlist, **kwargs):
-        self.node_uuid = dpg.generate_uuid()
+    def __init__(self, drawlist, backend=None, **kwargs):
+        self.backend = backend or drawing.active
+        self.node_uuid = self.backend.generate_uuid()
         self.drawlist_uuid = drawlist
         self.bg_offset = kwargs.get("bg_offset", 0)
         self.focal_offset = kwargs.get("focal_offset", 2)
         self.size = kwargs.get("size", 300)
         self.drawlist_x_center = (
-            dpg.get_item_width(self.drawlist_uuid) / 2 - self.size / 2
+            self.backend.get_item_width(self.drawlist_uuid) / 2 - self.size / 2
         )
         self.drawlist_y_center = (
-            dpg.get_item_height(self.drawlist_uuid) / 2 - self.size / 2
+            self.backend.get_item_height(self.drawlist_uuid) / 2 - self.size / 2
         )
         self.pixel_size = kwargs.get("pixel_size", 3)
         self.focal_size_rel = kwargs.get("focal_size_rel", .35)
@@ -39,24 +110,55 @@ class Anaglyph:
         self.bg_pixel_array = None
         self.mask_array = None
         self.focal_pixel_rng = None
-
-    def draw_focal(self, eye):
-        """Draws a diamond shaped focal point. Removes the datapoints for the focal point from
-        the pixel_array used for the background. This creates the illusion of the focal point
-        obscuring its background.
-
-        Focal offset creates the illusion of the focal point being in front of the background.
-        To achieve this effect, the focal point is shifted slightly to the center of vision
-        relative to the background. The brain interprets this as the object being closer.
-        """
-
+        self.renderer = kwargs.get("renderer", "texture")
+        if self.renderer not in ["texture", "rectangles"]:
+            raise ValueError(
+                "Wrong value given for 'renderer'. Accepted values are 'texture' and 'rectangles'."
+            )
+        self.texture_uuid = None
+        self.mode = kwargs.get("mode", "steps")
+        if self.mode not in ["steps", "smooth", "dynamic"]:
+            raise ValueError(
+                "Wrong value given for 'mode'. Accepted values are 'steps', 'smooth' and 'dynamic'."
+            )
+        self.ramp_deg_per_sec = kwargs.get("ramp_deg_per_sec", 0.5)
+        self.viewing_distance_cm = kwargs.get("viewing_distance_cm", 60)
+        self.pixels_per_cm = kwargs.get("pixels_per_cm", 38)
+
+        # Pixel arrays are allocated once and filled in place for every frame.
+        # Frames are recycled through release() once they have been rendered.
+        self.free_frames = []
+        self.layer_buffers = {
+            eye: np.zeros((self.pixel_count, self.pixel_count), dtype=bool)
+            for eye in ["left", "right"]
+        }
+        self.focal_buffer = np.zeros((self.pixel_count, self.pixel_count), dtype=bool)
+        self.bg_buffer = np.zeros((self.pixel_count, self.pixel_count), dtype=bool)
+        self.eye_index_buffer = np.zeros((self.pixel_count, self.pixel_count), dtype=np.uint8)
+        self.buffers = {}
+        # dynamic mode: random dots redrawn every frame, and the palette of the shown item
+        self.dynamic_frame = None
+        self.dynamic_palette = None
+        self.back_buffer = 0
+
+    def buffer(self, name, shape, dtype):
+        """Returns a named buffer of the given shape. The buffer is only reallocated when it
+        needs to grow, for instance when bg_offset makes the image wider."""
+        size = int(np.prod(shape))
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.size < size:
+            buffer = self.buffers[name] = np.empty(size, dtype=dtype)
+        return buffer[:size].reshape(shape)
+
+    def eye_params(self, eye):
+        """Returns the color, background offset and focal offset for the given eye."""
         if eye == "left":
-            color = dpg.get_value("color_left")
+            color = self.backend.get_value("color_left")
             bg_offset = int(self.bg_offset * -0.5)  # bg moves further apart
             focal_offset = int(self.focal_offset * 0.5)  # focal is moved closer
 
         if eye == "right":
-            color = dpg.get_value("color_right")
+            color = self.backend.get_value("color_right")
             bg_offset = int(self.bg_offset * 0.5)
             focal_offset = int(self.focal_offset * -0.5)
 
@@ -65,115 +167,367 @@ class Anaglyph:
                 "Wrong value given for 'eye'. Accepted values are 'left' and 'right'."
             )
 
-        focal_loc = {
-            "top": {"x": 0.5, "y": 0.25},
-            "bottom": {"x": 0.5, "y": 0.75},
-            "left": {"x": 0.25, "y": 0.5},
-            "right": {"x": 0.75, "y": 0.5},
-        }
-        x_min = int(self.pixel_count * focal_loc[self.focal_position]["x"])
-        y_min = int(self.pixel_count * focal_loc[self.focal_position]["y"]) - int(
-            self.focal_pixel_count / 2
+        return color, bg_offset, focal_offset
+
+    def eye_layer(self, eye):
+        """Returns a boolean array of the dots visible to the given eye and its background offset.
+        The array is indexed [x, y] like the pixel arrays it is built from. It is a buffer
+        owned by this object and is overwritten by the next call for the same eye."""
+        _, bg_offset, focal_offset = self.eye_params(eye)
+        focal_position = str(self.focal_position)
+        layer = self.layer_buffers[eye]
+
+        # background minus the shifted diamond
+        mask = diamond_mask(self.pixel_count, self.focal_pixel_count, focal_position, focal_offset)
+        np.greater(self.init_pixel_array, mask, out=layer)
+
+        # focal dots are picked from the unshifted diamond and moved by focal_offset
+        diamond = diamond_mask(self.pixel_count, self.focal_pixel_count, focal_position)
+        np.logical_and(diamond, self.focal_pixel_rng, out=self.focal_buffer)
+        if focal_offset >= 0:
+            target = layer[focal_offset:]
+            source = self.focal_buffer[:self.pixel_count - focal_offset]
+        else:
+            target = layer[:focal_offset]
+            source = self.focal_buffer[-focal_offset:]
+        np.logical_or(target, source, out=target)
+        return layer, bg_offset
+
+    def palette(self):
+        """Returns the four colors a texel can have as RGBA floats: no dot, a left eye dot,
+        a right eye dot, and a right eye dot drawn over a left eye dot."""
+        def rgba(color):
+            color = np.array(color, dtype=np.float32) / 255
+            return np.append(color, 1) if len(color) == 3 else color
+
+        left = rgba(self.eye_params("left")[0])
+        right = rgba(self.eye_params("right")[0])
+        alpha = right[3] + left[3] * (1 - right[3])
+        both = (right[:3] * right[3] + left[:3] * left[3] * (1 - right[3])) / alpha if alpha else right[:3]
+        return np.array(
+            [[0, 0, 0, 0], left, right, np.append(both, alpha)], dtype=np.float32
         )
 
-        # create a matrix containing the diamond shape focal point
-        diamond_builder = []
-        # step means: how many extra pixels to draw on each subsequent row of the matrix
-        # by incrementing the amount of pixels to draw, a triangle shape is created
-        step = round(self.focal_pixel_count / (self.focal_pixel_count / 2))
-        # create a list of the number of pixels to draw on each row
-        [diamond_builder.append(i) for i in range(0, self.focal_pixel_count, step)]
-        # finally, extend the list with itself reversed, 
-        # effectively appending an upside down triangle
-        diamond_builder.extend(list(diamond_builder[::-1]))
-
-        for y, pixels in enumerate(diamond_builder):
-            center = round(self.focal_size / 2)  # find middle of array
-            y = y_min + y  # == y_min + current row
-            x = int(x_min - pixels / 2)  # half of the pixels to be drawn
-            # must be drawn left of center
-            for x in range(x, x + pixels):
-                self.mask_array[x + focal_offset, y] = 1  # draw the diamond in the mask array
-                if self.focal_pixel_rng[x, y] == 1:
-                    draw_x = (
-                        x + bg_offset + focal_offset
-                    ) * self.pixel_size + self.drawlist_x_center
-                    draw_y = y * self.pixel_size + self.drawlist_y_center
-                    dpg.draw_rectangle(
-                        (draw_x, draw_y),
-                        (draw_x + self.pixel_size, draw_y + self.pixel_size),
-                        fill=color,
-                        color=color,
-                    )
-
-        self.bg_pixel_array = (
-            self.bg_pixel_array - self.mask_array
-        )  # cut the mask array out of the bg array
-
-    def draw_bg(self, eye):
-        """Draws the background from a randomly generated self.bg_pixel_array. Draw_focal needs to be called beforehand
-        so the pixels in the focal point are removed from the background array."""
+    def texture_pixels(self, rgba_name="rgba", palette=None):
+        """Fills the named RGBA buffer with both eyes and returns it, with the padding in dots
+        added on both sides for the background offset.
 
-        if eye == "left":
-            color = dpg.get_value("color_left")
-            bg_offset = int(self.bg_offset * -0.5)
+        Every texel gets an index: bit 1 for a left eye dot, bit 2 for a right eye dot.
+        The palette turns the indices into colors, blended in the same order as the
+        rectangles would be drawn: the right eye on top of the left eye. All work is
+        done in preallocated buffers.
+        """
+        layers = [self.eye_layer(eye) for eye in ["left", "right"]]
+        pad = max(abs(bg_offset) for _, bg_offset in layers)
+        width = self.pixel_count + 2 * pad
+        index = self.buffer("index", (self.pixel_count, width), np.uint8)
+        index.fill(0)
+
+        for bit, (layer, bg_offset) in enumerate(layers):
+            x = pad + bg_offset
+            region = index[:, x:x + self.pixel_count]
+            np.left_shift(layer.view(np.uint8), bit, out=self.eye_index_buffer)
+            np.bitwise_or(region, self.eye_index_buffer.T, out=region)  # image rows run along y
+
+        # scale up so one texel maps to one screen pixel
+        ps = self.pixel_size
+        height, width = self.pixel_count * ps, width * ps
+        scaled = self.buffer("scaled_index", (height, width), np.uint8)
+        scaled.reshape(self.pixel_count, ps, width // ps, ps)[...] = index[:, None, :, None]
+        rgba = self.buffer(rgba_name, (height, width, 4), np.float32)
+        np.take(self.palette() if palette is None else palette, scaled, axis=0, out=rgba, mode="clip")
+        return rgba, pad
+
+    @tracing.traced()
+    def draw_texture(self):
+        """Draws both eyes into one RGBA buffer and shows it as a single image, see
+        texture_pixels(). Returns the uuid of the texture, which has to be deleted
+        together with the draw_node.
+        """
+        rgba, pad = self.texture_pixels()
+        height, width = rgba.shape[:2]
+        texture_uuid = self.backend.add_dynamic_texture(width, height, rgba.ravel())
+        x_min = self.drawlist_x_center - pad * self.pixel_size
+        self.backend.draw_image(
+            texture_uuid,
+            pmin=(x_min, self.drawlist_y_center),
+            pmax=(x_min + width, self.drawlist_y_center + height),
+            parent=self.node_uuid,
+        )
+        return texture_uuid
+
+    @tracing.traced()
+    def refresh(self, item):
+        """Dynamic mode: draws new random dots into the texture of the shown item, keeping its
+        focal position and offsets. The dots are drawn into one of two RGBA buffers in turn, so
+        the buffer last handed to the texture is never overwritten while it is in use.
+        Allocates no arrays.
+        """
+        frame = self.dynamic_frame
+        for bits in frame.bits:
+            random_bits(self.rng, bits)
+        self.focal_position = item.focal_position
+        self.init_pixel_array = frame.init_pixel_array
+        self.focal_pixel_rng = frame.focal_pixel_rng
+        self.back_buffer = 1 - self.back_buffer
+        rgba, _ = self.texture_pixels(DYNAMIC_BUFFERS[self.back_buffer], self.dynamic_palette)
+        self.backend.set_value(item.texture_uuid, rgba.ravel())
+
+    @tracing.traced()
+    def draw_layers(self):
+        """Draws each eye into its own drawing.Node, without background offset. Both eyes come
+        from one texture, the left eye above the right eye. The right eye is drawn on top, as in
+        draw_texture(). Returns the uuid of the texture and the left and right Node.
+        """
+        ps = self.pixel_size
+        size = self.pixel_count * ps
+        scaled = self.buffer("layer_index", (size, size), np.uint8)
+        rgba = self.buffer("layers_rgba", (2, size, size, 4), np.float32)
+        palette = self.palette()
+        for bit, eye in enumerate(["left", "right"]):
+            layer, _ = self.eye_layer(eye)
+            np.left_shift(layer.view(np.uint8), bit, out=self.eye_index_buffer)
+            scaled.reshape(self.pixel_count, ps, self.pixel_count, ps)[...] = self.eye_index_buffer.T[:, None, :, None]
+            np.take(palette, scaled, axis=0, out=rgba[bit], mode="clip")
+
+        texture_uuid = self.backend.add_dynamic_texture(size, 2 * size, rgba.ravel())
+        layers = []
+        for i in range(2):
+            node = drawing.Node(self.node_uuid, backend=self.backend)
+            self.backend.draw_image(
+                texture_uuid,
+                pmin=(self.drawlist_x_center, self.drawlist_y_center),
+                pmax=(self.drawlist_x_center + size, self.drawlist_y_center + size),
+                parent=node.tag,
+                uv_min=(0.0, i / 2),
+                uv_max=(1.0, (i + 1) / 2),
+            )
+            layers.append(node)
+        return texture_uuid, layers
+
+    def shift(self, item, disparity):
+        """Moves the eyes of an item drawn in smooth mode apart by disparity dots, like bg_offset.
+        Only applies transforms: the cost does not depend on the image."""
+        left, right = item.layers
+        offset = disparity * self.pixel_size / 2
+        left.move_to(-offset, 0)
+        right.move_to(offset, 0)
+
+    @tracing.traced_chunks()
+    def draw_focal(self, eye):
+        """Draws a diamond shaped focal point. Removes the datapoints for the focal point from
+        the pixel_array used for the background. This creates the illusion of the focal point
+        obscuring its background. A generator, yielding every RECT_CHUNK rectangles.
 
-        if eye == "right":
-            color = dpg.get_value("color_right")
-            bg_offset = int(self.bg_offset * 0.5)
+        Focal offset creates the illusion of the focal point being in front of the background.
+        To achieve this effect, the focal point is shifted slightly to the center of vision
+        relative to the background. The brain interprets this as the object being closer.
+        """
 
-        if eye not in ["left", "right"]:
-            raise ValueError(
-                "Wrong value given for 'eye'. Accepted values are 'left' and 'right'."
+        color, bg_offset, focal_offset = self.eye_params(eye)
+
+        # focal dots are picked from the unshifted diamond and drawn shifted by both offsets
+        focal_position = str(self.focal_position)
+        diamond = diamond_mask(self.pixel_count, self.focal_pixel_count, focal_position)
+        xs, ys = (diamond & (self.focal_pixel_rng == 1)).nonzero()
+        for i, (x, y) in enumerate(zip(xs, ys), 1):
+            draw_x = (x + bg_offset + focal_offset) * self.pixel_size + self.drawlist_x_center
+            draw_y = y * self.pixel_size + self.drawlist_y_center
+            self.backend.draw_rectangle(
+                (draw_x, draw_y),
+                (draw_x + self.pixel_size, draw_y + self.pixel_size),
+                fill=color,
+                color=color,
+                parent=self.node_uuid,
             )
+            if i % RECT_CHUNK == 0:
+                yield
+
+        self.mask_array = diamond_mask(self.pixel_count, self.focal_pixel_count, focal_position, focal_offset)
+        # cut the mask array out of the bg array
+        np.greater(self.bg_pixel_array, self.mask_array, out=self.bg_buffer)
+        self.bg_pixel_array = self.bg_buffer
+
+    @tracing.traced_chunks()
+    def draw_bg(self, eye):
+        """Draws the background from a randomly generated self.bg_pixel_array. Draw_focal needs to be called beforehand
+        so the pixels in the focal point are removed from the background array. A generator, yielding every
+        RECT_CHUNK rectangles."""
+
+        color, bg_offset, _ = self.eye_params(eye)
 
         pixels = (self.bg_pixel_array > 0).nonzero()
         coords = zip(pixels[0], pixels[1])
-        for x, y in coords:
+        for i, (x, y) in enumerate(coords, 1):
             x = (x + bg_offset) * self.pixel_size + self.drawlist_x_center
             y = y * self.pixel_size + self.drawlist_y_center
-            dpg.draw_rectangle(
+            self.backend.draw_rectangle(
                 (x, y),
                 (x + self.pixel_size, y + self.pixel_size),
                 fill=color,
                 color=color,
+                parent=self.node_uuid,
             )
+            if i % RECT_CHUNK == 0:
+                yield
 
         # cleanup arrays for second pass of drawing
         self.bg_pixel_array = self.init_pixel_array
-        self.mask_array = np.zeros((self.pixel_count, self.pixel_count), dtype=int)
 
+    @tracing.traced()
+    def generate(self):
+        """Generates the random parts of a frame: the focal position and the pixel arrays.
+        Does not touch dpg, so frames can be generated ahead of time. Reuses the buffers
+        of released frames."""
+        if self.free_frames:
+            frame = self.free_frames.pop()
+        else:
+            # pad to whole 64 bit words for random_bits()
+            words = -(-self.pixel_count * self.pixel_count // 64)
+            frame = namedtuple("Frame", ["focal_position", "init_pixel_array", "focal_pixel_rng", "bits"])(
+                None, None, None, np.empty((2, words * 64), dtype=np.uint8)
+            )
+        for bits in frame.bits:
+            random_bits(self.rng, bits)
+        pixels = frame.bits[:, :self.pixel_count * self.pixel_count].view(bool)
+        return frame._replace(
+            focal_position=FOCAL_POSITIONS[self.rng.integers(len(FOCAL_POSITIONS))],
+            init_pixel_array=pixels[0].reshape(self.pixel_count, self.pixel_count),
+            focal_pixel_rng=pixels[1].reshape(self.pixel_count, self.pixel_count),
+        )
+
+    def release(self, frame):
+        """Hands the buffers of a rendered frame back for reuse by generate()."""
+        self.free_frames.append(frame)
+
+    @tracing.traced()
+    def render(self, frame, bg_offset=None):
+        """Draws a hidden draw_node from a frame made by generate().
+
+        :param frame: the random parts of the image.
+        :param bg_offset: optional new background offset to draw the frame with.
+        """
+        return jobs.complete(self.render_chunks(frame, bg_offset))
+
+    @tracing.traced_chunks()
+    def render_chunks(self, frame, bg_offset=None):
+        """render() as a job for the jobs module, yielding between chunks of drawing. The
+        rectangles renderer yields every RECT_CHUNK rectangles. No other frame may be
+        rendered until the job is finished: they share the state of this object.
+        """
+        if bg_offset is not None:
+            self.bg_offset = bg_offset
+        self.node_uuid = str(self.backend.generate_uuid())
+        helpers.debugger('drawing %s', self.node_uuid)
+
+        def draw_eye(eye):
+            yield from self.draw_focal(eye)
+            yield from self.draw_bg(eye)
+
+        # items get an explicit parent: render may run outside the main thread,
+        # and backends have no container stack
+        self.backend.draw_node(parent=self.drawlist_uuid, tag=self.node_uuid, show=False)
+        yield
+
+        # set after the yield: refresh() changes them between frames
+        self.focal_position = frame.focal_position
+        self.init_pixel_array = frame.init_pixel_array
+        self.bg_pixel_array = self.init_pixel_array
+        self.focal_pixel_rng = frame.focal_pixel_rng
+        layers = None
+        if self.mode == "smooth":
+            self.texture_uuid, layers = self.draw_layers()
+        elif self.mode == "dynamic":
+            if self.dynamic_frame is None:
+                self.dynamic_frame = self.generate()
+            self.dynamic_palette = self.palette()
+            self.texture_uuid = self.draw_texture()
+        elif self.renderer == "texture":
+            self.texture_uuid = self.draw_texture()
+        else:
+            self.texture_uuid = None
+            yield from draw_eye("left")
+            yield from draw_eye("right")
+
+        # return a namedtuple for legibility in other places
+        Drawing = namedtuple("Drawing", ["node_uuid", "focal_position", "texture_uuid", "layers"])
+        return Drawing(self.node_uuid, self.focal_position, self.texture_uuid, layers)
+
+    @tracing.traced()
     def draw(self):
         """Takes care of drawing two anaglyph images with focal points and backgrounds correctly spaced.
         Can be used by DrawQueue to create a queued draw_node."""
+        frame = self.generate()
+        drawing = self.render(frame)
+        self.release(frame)
+        return drawing
+
+class Ramp:
+    """Changes the disparity of the shown smooth mode item every frame, at a constant rate.
+    Every item starts at the disparity of session.primary_param.
+
+    :param anaglyph: Anaglyph in smooth mode.
+    :param queue: DrawQueue of its items.
+    :param session: EvaluationSession. Its frame_stats are set to the frame times of the ramp.
+    :param dots_per_sec: rate of change of the disparity, its sign is the direction.
+    """
 
-        helpers.debugger(f"drawing {self.node_uuid}")
+    def __init__(self, anaglyph, queue, session, dots_per_sec):
+        self.anaglyph = anaglyph
+        self.queue = queue
+        self.session = session
+        self.dots_per_sec = dots_per_sec
+        # beyond half the image the eyes hardly overlap
+        self.limit = anaglyph.pixel_count / 2
+        self.start = session.primary_param
+        self.frame_stats = session.frame_stats = helpers.FrameStats()
+
+    def disparity(self, now_ns):
+        """Disparity in dots of the shown item at perf_counter_ns() now_ns."""
+        elapsed = (now_ns - self.queue.shown_ns) / 1e9
+        return max(-self.limit, min(self.limit, self.start + self.dots_per_sec * elapsed))
+
+    def next(self):
+        """Shows the next queued item, at the disparity of session.primary_param."""
+        self.start = self.session.primary_param
+        self.anaglyph.shift(self.queue.queue[0], self.start)
+        self.queue.next()
+
+    def frame(self, *_):
+        """Call once per frame. Records the frame time and moves the eyes of the shown item."""
+        now_ns = perf_counter_ns()
+        self.frame_stats.tick(now_ns)
+        if self.session.active and self.queue.current_item:
+            self.anaglyph.shift(self.queue.current_item, self.disparity(now_ns))
+
+
+class Refresh:
+    """Draws new random dots for the shown dynamic mode item every frame.
+
+    :param anaglyph: Anaglyph in dynamic mode.
+    :param queue: DrawQueue of its items, without prefetching: refresh() and render() share buffers.
+    :param session: EvaluationSession. Its frame_stats are set to the frame times.
+    """
 
-        # initialize random arrays for every draw_node
-        self.node_uuid = str(dpg.generate_uuid())
-        self.focal_position = np.random.choice(["top", "bottom", "left", "right"])
-        self.rng = np.random.default_rng()
-        self.init_pixel_array = self.rng.choice(
-            [0, 1], size=(self.pixel_count, self.pixel_count)
-        )
-        self.bg_pixel_array = self.init_pixel_array
-        self.mask_array = np.zeros((self.pixel_count, self.pixel_count), dtype=int)
-        self.focal_pixel_rng = self.rng.choice(
-            [0, 1], size=(self.pixel_count, self.pixel_count)
-        )
+    def __init__(self, anaglyph, queue, session):
+        self.anaglyph = anaglyph
+        self.queue = queue
+        self.session = session
+        self.frame_stats = session.frame_stats = helpers.FrameStats()
 
-        def draw_eye(eye):
-            self.draw_focal(eye)
-            self.draw_bg(eye)
+    def frame(self, *_):
+        """Call once per frame. Records the frame time and redraws the dots of the shown item."""
+        self.frame_stats.tick(perf_counter_ns())
+        if self.session.active and self.queue.current_item:
+            self.anaglyph.refresh(self.queue.current_item)
 
-        with dpg.draw_node(tag=self.node_uuid, parent=self.drawlist_uuid):
-            dpg.hide_item(self.node_uuid)
-            draw_eye("left")
-            draw_eye("right")
 
-        # return a namedtuple for legibility in other places
-        drawing = namedtuple("Drawing", ["node_uuid", "focal_position"])
-        return drawing(self.node_uuid, self.focal_position)
+def every_frame(session, callback):
+    """Calls callback every frame while the drawlist of the session is visible, until the session ends."""
+    handlers = dpg.add_item_handler_registry()
+    dpg.add_item_visible_handler(callback=callback, parent=handlers)
+    dpg.bind_item_handler_registry(session.drawlist_uuid, handlers)
+    session.on_end.append(lambda: dpg.delete_item(handlers))
 
 
 def run(config):
@@ -185,12 +539,20 @@ def run(config):
     :param fail_threshold: number of wrong answers needed to reset primary parameter to its initial_value.
     :param count: number of iterations of the sequence.
     :param duration_secs: duration of the sequence in seconds.
+    :param prefetch_depth: (Exercise) number of frames drawn ahead of time. Defaults to 2.
 
+    With mode: smooth, the disparity ramps continuously from primary_param in the direction of
+    step. An answer is recorded at the disparity reached and the next item continues from it,
+    unless fail_threshold resets it. Every success_threshold correct answers still add step.
+    With mode: dynamic, the dots of the shown item are drawn anew every frame, as a dynamic
+    random-dot stereogram. Items are not prefetched in this mode.
     """
 
+    @tracing.traced_callback('vergence.evaluate')
     def evaluate(sender, app_data):
         """Keypress callback function containing the evaluation logic.
         Add results to the session object. Add drawnodes to the queue."""
+        key_ns = perf_counter_ns()
         key = helpers.translate_key(app_data)
         possible_answers = {
             "left": "left",
@@ -198,20 +560,24 @@ def run(config):
             "up": "top",
             "down": "bottom",
         }
-        if key in possible_answers:
-            helpers.debugger(f"current item: {queue.current_item}")
+        if key in possible_answers and not queue.waiting:
+            helpers.debugger('current item: %s', queue.current_item)
             result = possible_answers.get(key) == queue.current_item.focal_position
-            session.add_result(result)
+            if ramp:
+                session.primary_param = round(ramp.disparity(key_ns))
+            session.add_result(result, shown_ns=queue.shown_ns, key_ns=key_ns)
 
             if session.active:
-                anaglyph.bg_offset = session.primary_param
-                queue.add(anaglyph.draw())
-                queue.next()
+                # the next item may be drawn by a job first, see DrawQueue.add_prefetched()
+                queue.add_prefetched(0 if ramp else session.primary_param, on_ready=show_next)
 
-    session_config = config.get("Session")  # this config part is required
-    exercise_config = config.get("Exercise", {})  # this config part is optional
+    def show_next():
+        (ramp or queue).next()
+        session.complete_result()
+
+    session_config = config.session  # this config part is required
+    exercise_config = config.exercise_params  # this config part is optional
     session = helpers.EvaluationSession(**session_config)
-    queue = helpers.DrawQueue()
     viewp_h, viewp_w = dpg.get_viewport_height(), dpg.get_viewport_width()
     # create keypress handler for this evaluation
     with dpg.handler_registry(tag=session.handler_uuid):
@@ -246,5 +612,28 @@ def run(config):
         # Finally, create the anaglyph object and draw the first frame.
         anaglyph = Anaglyph(drawlist=session.drawlist_uuid, **exercise_config)
 
-        queue.add(anaglyph.draw())
-        queue.next()
+        # frames for the next answers are drawn in chunks between frames by the job runner
+        queue = helpers.DrawQueue(
+            prefetch_depth=0 if anaglyph.mode == "dynamic" else exercise_config.get("prefetch_depth", 2),
+            generate=anaglyph.generate,
+            render=anaglyph.render,
+            release=anaglyph.release,
+            render_chunks=anaglyph.render_chunks,
+            runner=jobs.runner if jobs.runner.running else None,
+        )
+        session.on_end.append(queue.close)
+
+        if anaglyph.mode == "smooth":
+            # items are drawn without disparity, the ramp moves the eyes apart every frame
+            direction = 1 if session.step >= 0 else -1
+            dots_per_sec = direction * anaglyph.ramp_deg_per_sec * dots_per_degree(
+                anaglyph.pixel_size, anaglyph.viewing_distance_cm, anaglyph.pixels_per_cm
+            )
+            ramp = Ramp(anaglyph, queue, session, dots_per_sec)
+            every_frame(session, ramp.frame)
+            queue.add_prefetched(0, on_ready=ramp.next)
+        else:
+            ramp = None
+            if anaglyph.mode == "dynamic":
+                every_frame(session, Refresh(anaglyph, queue, session).frame)
+            queue.add_prefetched(session.primary_param, on_ready=queue.next)
@@ -0,0 +1,125 @@
+"""Module containing the stimulus texture atlas for Vizier.
+
+All png images under image_path (arrows and other stimulus glyphs) are packed into a
+single texture. Exercises draw an image as a UV sub-rectangle of that texture with
+draw(), by its file name, so a frame binds one texture however many images it shows.
+
+The packed atlas is cached on disk. The cache is used as long as the paths, modification
+times and sizes of the source images are unchanged.
+"""
+
+import json
+import logging
+import weakref
+import dearpygui.dearpygui as dpg
+import numpy as np
+from collections import namedtuple
+from pathlib import Path
+from . import configuration
+from . import drawing
+from . import helpers
+
+CACHE_PATH = './vizier/userdata/stimulus_atlas.npz'
+# transparent pixels around every image, so linear filtering does not bleed in neighbours
+PADDING = 1
+
+# pixels: float32 RGBA of height x width x 4
+# regions: image file name: (uv_min, uv_max)
+Atlas = namedtuple('Atlas', ['width', 'height', 'pixels', 'regions'])
+
+packed = None
+# backend: tag of the atlas texture registered with it
+textures = weakref.WeakKeyDictionary()
+
+def sources(image_path):
+    """The png images under image_path and the (path, mtime, size) key identifying them."""
+    paths = sorted(path for path in helpers.dirwalk(image_path) if path.suffix == '.png')
+    key = [(str(path), path.stat().st_mtime_ns, path.stat().st_size) for path in paths]
+    return paths, json.dumps(key)
+
+def pack(sizes, padding=PADDING):
+    """Shelf packing: places rectangles in rows, tallest first, in a square-ish power of two width.
+
+    :param sizes: list of (width, height).
+    :return: atlas width, atlas height and the (x, y) of every rectangle.
+    """
+    area = sum((w + 2 * padding) * (h + 2 * padding) for w, h in sizes)
+    widest = max((w + 2 * padding for w, _ in sizes), default=1)
+    atlas_width = 1 << (max(widest, int(np.ceil(np.sqrt(area)))) - 1).bit_length()
+    positions = [None] * len(sizes)
+    x = y = shelf_height = 0
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        w, h = sizes[i][0] + 2 * padding, sizes[i][1] + 2 * padding
+        if x + w > atlas_width:
+            x, y, shelf_height = 0, y + shelf_height, 0
+        positions[i] = (x + padding, y + padding)
+        x += w
+        shelf_height = max(shelf_height, h)
+    return atlas_width, max(y + shelf_height, 1), positions
+
+def build(paths):
+    """Packs images into an Atlas."""
+    images = []
+    for path in paths:
+        width, height, _, data = dpg.load_image(str(path))
+        images.append(np.frombuffer(data, dtype=np.float32).reshape(height, width, 4))
+    width, height, positions = pack([(image.shape[1], image.shape[0]) for image in images])
+    pixels = np.zeros((height, width, 4), dtype=np.float32)
+    regions = {}
+    for path, image, (x, y) in zip(paths, images, positions):
+        h, w = image.shape[:2]
+        pixels[y:y + h, x:x + w] = image
+        regions[path.name] = ((x / width, y / height), ((x + w) / width, (y + h) / height))
+    return Atlas(width, height, pixels, regions)
+
+def read_cache(cache_path, key):
+    """The cached Atlas, or None if there is none or it was built from other sources."""
+    try:
+        with np.load(cache_path) as cache:
+            if str(cache['key']) != key:
+                return None
+            regions = json.loads(str(cache['regions']))
+            pixels = cache['pixels'].astype(np.float32) / 255
+    except (OSError, KeyError, ValueError):
+        return None
+    height, width = pixels.shape[:2]
+    return Atlas(width, height, pixels, {name: tuple(map(tuple, uv)) for name, uv in regions.items()})
+
+def write_cache(cache_path, key, atlas):
+    # images are 8 bit, so storing the atlas as bytes loses nothing
+    try:
+        Path(cache_path).parent.mkdir(parents=True, exist_ok=True)
+        np.savez_compressed(cache_path, key=key, regions=json.dumps(atlas.regions),
+                            pixels=np.rint(atlas.pixels * 255).astype(np.uint8))
+    except OSError:
+        logging.exception('Could not cache the stimulus atlas')
+
+def load(image_path=None, cache_path=CACHE_PATH):
+    """Returns the stimulus Atlas, read from the cache or built and cached on first use."""
+    global packed
+    if packed is None:
+        paths, key = sources(image_path or configuration.application().image_path)
+        packed = read_cache(cache_path, key)
+        if packed is None:
+            packed = build(paths)
+            write_cache(cache_path, key, packed)
+    return packed
+
+def texture(backend=None):
+    """Tag of the atlas texture, registered with the backend on first use."""
+    backend = backend or drawing.active
+    tag = textures.get(backend)
+    if tag is None or not backend.does_item_exist(tag):
+        atlas = load()
+        tag = backend.add_static_texture(atlas.width, atlas.height, atlas.pixels.ravel())
+        textures[backend] = tag
+    return tag
+
+def draw(name, pmin, pmax, parent, backend=None):
+    """Draws the image with file name name from the atlas.
+
+    :param name: file name of the image, see imagemap.
+    """
+    backend = backend or drawing.active
+    uv_min, uv_max = load().regions[name]
+    return backend.draw_image(texture(backend), pmin, pmax, parent, uv_min=uv_min, uv_max=uv_max)
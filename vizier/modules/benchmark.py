@@ -0,0 +1,724 @@
+"""Module containing benchmarks for Vizier. Run with 'python -m vizier bench'.
+
+All benchmarks run headless on the recording backend. Exercises are timed per
+configuration in exercise_configs.yaml and the results are saved as JSON, so runs
+on different commits can be compared with --compare.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import tracemalloc
+import yaml
+import numpy as np
+import peewee as pw
+import dearpygui.dearpygui as dpg
+from datetime import datetime
+from pathlib import Path
+from time import perf_counter, perf_counter_ns
+from uuid import uuid4
+from .. import __version__
+from ..exercises import vergence, recognition, depth_perception, alignment
+from ..exercises.vergence import Anaglyph, diamond_mask
+from . import drawing
+from . import helpers
+from . import atlas
+from . import configuration
+from . import jobs
+from . import profile
+from . import tracing
+from .profile_datamodel import PRAGMAS, User, Session, Answer, SessionSummary, DailySummary
+from .profile_datamodel import backfill_summaries, migrate_results
+
+try:
+    import resource
+except ImportError:     # not available on Windows
+    resource = None
+
+# exercise class per 'Plugin:' in exercise_configs.yaml
+EXERCISES = {
+    'vergence': vergence.Anaglyph,
+    'recognition': recognition.Recognition,
+    'depth_perception': depth_perception.DepthPerception,
+    'alignment': alignment.Alignment,
+}
+
+# tables written by the result writer, bound to a scratch database by the persistence benchmarks
+PROFILE_TABLES = [User, Session, Answer, SessionSummary, DailySummary]
+
+def headless_drawlist(width=1000, height=700):
+    """Switches to a recording backend and returns a drawlist of the size an exercise window would have."""
+    backend = drawing.RecordingBackend()
+    drawing.use(backend)
+    return backend.add_drawlist(width=width, height=height * 0.90)
+
+def legacy_pixel_arrays(anaglyph):
+    """The pixel pipeline as it was before the buffers were preallocated: int64 random arrays,
+    a fresh mask and a fresh subtraction result for every eye."""
+    rng = np.random.default_rng()
+    init_pixel_array = rng.choice([0, 1], size=(anaglyph.pixel_count, anaglyph.pixel_count))
+    focal_pixel_rng = rng.choice([0, 1], size=(anaglyph.pixel_count, anaglyph.pixel_count))
+    for eye in ['left', 'right']:
+        mask_array = np.zeros((anaglyph.pixel_count, anaglyph.pixel_count), dtype=int)
+        mask_array[diamond_mask(anaglyph.pixel_count, anaglyph.focal_pixel_count, 'top')] = 1
+        bg_pixel_array = init_pixel_array - mask_array
+
+def buffered_pixel_arrays(anaglyph):
+    """The current pixel pipeline: generate a frame and build both eye layers."""
+    frame = anaglyph.generate()
+    anaglyph.focal_position = frame.focal_position
+    anaglyph.init_pixel_array = frame.init_pixel_array
+    anaglyph.focal_pixel_rng = frame.focal_pixel_rng
+    for eye in ['left', 'right']:
+        anaglyph.eye_layer(eye)
+    anaglyph.release(frame)
+
+def pixel_memory(func, anaglyph, trials=100, warmup=20):
+    """Returns the peak memory allocated during a single trial and the memory still held
+    after all trials, in bytes. Warmup trials fill buffers and caches and are not measured."""
+    for _ in range(warmup):
+        func(anaglyph)
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    peak_per_trial = 0
+    for _ in range(trials):
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        func(anaglyph)
+        _, peak = tracemalloc.get_traced_memory()
+        peak_per_trial = max(peak_per_trial, peak - before)
+    retained = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return peak_per_trial, retained
+
+def anaglyph_memory(sizes=((300, 3), (150, 2), (300, 1))):
+    """Compares per-trial memory churn of the legacy and buffered anaglyph pixel pipelines."""
+    drawlist = headless_drawlist()
+    print(f'{"size":>6} {"pixel":>6} {"legacy peak":>12} {"buffered peak":>14} {"ratio":>6} {"retained":>9}')
+    for size, pixel_size in sizes:
+        anaglyph = Anaglyph(drawlist, size=size, pixel_size=pixel_size)
+        legacy, _ = pixel_memory(legacy_pixel_arrays, anaglyph)
+        buffered, retained = pixel_memory(buffered_pixel_arrays, anaglyph)
+        print(f'{size:>6} {pixel_size:>6} {legacy:>12} {buffered:>14} {legacy / max(buffered, 1):>6.1f} {retained:>9}')
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KB, or None where it cannot be measured."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak  # macOS reports bytes
+
+def latencies(samples_ns):
+    """Summarizes a list of durations in ns as p50/p95/p99/max in ms."""
+    if not samples_ns:
+        return None
+    p50, p95, p99 = np.percentile(samples_ns, [50, 95, 99]) / 1e6
+    return {'p50_ms': round(p50, 4), 'p95_ms': round(p95, 4), 'p99_ms': round(p99, 4),
+            'max_ms': round(max(samples_ns) / 1e6, 4)}
+
+def exercise_trials(config, trials):
+    """Times stimulus generation, draw item construction, queueing and session bookkeeping
+    for one configuration.Configuration. Returns a dict of results."""
+    backend = drawing.RecordingBackend()
+    drawing.use(backend)
+    drawlist = backend.add_drawlist(width=1000, height=630)
+    # the staged reveal is scheduled, not slept; zero delays keep the timelines comparable
+    exercise_config = dict(config.exercise_params, display_delay_secs=0)
+    exercise = EXERCISES[config.plugin](drawlist, **exercise_config)
+    session = helpers.EvaluationSession(**config.session)
+    queue = helpers.DrawQueue()
+    timings = {'generate': [], 'draw': [], 'queue': [], 'session': []}
+    items_before = sum(backend.created.values())
+    peak_threads = threading.active_count()
+
+    for trial in range(trials):
+        if hasattr(exercise, 'generate'):
+            start = perf_counter_ns()
+            frame = exercise.generate()
+            timings['generate'].append(perf_counter_ns() - start)
+            start = perf_counter_ns()
+            item_tuple = exercise.render(frame, session.primary_param)
+            timings['draw'].append(perf_counter_ns() - start)
+            exercise.release(frame)
+        else:
+            start = perf_counter_ns()
+            item_tuple = exercise.draw()
+            timings['draw'].append(perf_counter_ns() - start)
+
+        start = perf_counter_ns()
+        queue.add(item_tuple)
+        queue.next()
+        timings['queue'].append(perf_counter_ns() - start)
+
+        start = perf_counter_ns()
+        session.add_result(bool(trial % 3))
+        timings['session'].append(perf_counter_ns() - start)
+        peak_threads = max(peak_threads, threading.active_count())
+
+    items = sum(backend.created.values()) - items_before
+    if session.active:
+        session.end()
+    return {
+        'latency': {name: latencies(samples) for name, samples in timings.items()},
+        'items_per_trial': round(items / trials, 2),
+        'items_by_type': dict(backend.created),
+        'peak_rss_kb': peak_rss_kb(),
+        'peak_threads': peak_threads,
+    }
+
+def exercises(trials=100, config_path=configuration.EXERCISE_CONFIG_PATH):
+    """Runs exercise_trials for every Plugin/Configuration pair. Returns a dict of results."""
+    results = {}
+    for exercise in configuration.exercises(config_path):
+        for config in exercise.configurations:
+            key = f'{exercise.name}/{config.difficulty}'
+            results[key] = exercise_trials(config, trials)
+            latency = results[key]['latency']
+            print(f'{key:<32} draw p50 {latency["draw"]["p50_ms"]:>9.3f} ms  '
+                  f'p99 {latency["draw"]["p99_ms"]:>9.3f} ms  '
+                  f'items/trial {results[key]["items_per_trial"]:>9}')
+    return results
+
+def smooth_frames(frames=6000, config_path=configuration.EXERCISE_CONFIG_PATH):
+    """Times the per frame work of the smooth vergence ramp: recording the frame time and
+    moving both eyes. Returns the time per frame and the memory held after the frames."""
+    config = next(config for exercise in configuration.exercises(config_path) for config in exercise.configurations
+                  if config.exercise_params.get('mode') == 'smooth')
+    backend = drawing.RecordingBackend()
+    drawing.use(backend)
+    anaglyph = vergence.Anaglyph(backend.add_drawlist(width=1000, height=630), **config.exercise_params)
+    session = helpers.EvaluationSession(**config.session)
+    queue = helpers.DrawQueue(generate=anaglyph.generate, render=anaglyph.render, release=anaglyph.release)
+    ramp = vergence.Ramp(anaglyph, queue, session, dots_per_sec=10)
+    queue.add_prefetched(0)
+    ramp.next()
+    ramp.frame()
+    frame_ns = np.zeros(frames, dtype=np.int64)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(frames):
+        start = perf_counter_ns()
+        ramp.frame()
+        frame_ns[i] = perf_counter_ns() - start
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    session.end()
+    report = {'frame': latencies(frame_ns.tolist()), 'bytes_held': held}
+    print(f'Smooth vergence: {report["frame"]["p50_ms"] * 1000:.1f} us p50, {report["frame"]["p99_ms"] * 1000:.1f} us p99 '
+          f'per frame, {held} bytes held after {frames} frames')
+    return report
+
+def dynamic_frames(frames=600, size=300, pixel_size=2, bg_offset=4):
+    """Times redrawing the dots of a dynamic random-dot stereogram every frame, against drawing a
+    new item per frame with Anaglyph.draw(). Returns the time per frame, the memory held after the
+    frames and whether the p99 fits the 60 fps frame budget."""
+    backend = drawing.RecordingBackend()
+    drawing.use(backend)
+    drawlist = backend.add_drawlist(width=1000, height=630)
+    report = {'size': size, 'pixel_size': pixel_size}
+
+    legacy = vergence.Anaglyph(drawlist, size=size, pixel_size=pixel_size, bg_offset=bg_offset)
+    legacy_ns = []
+    for _ in range(frames // 10):
+        start = perf_counter_ns()
+        item = legacy.draw()
+        legacy_ns.append(perf_counter_ns() - start)
+        backend.delete_item(item.node_uuid)
+        backend.delete_item(item.texture_uuid)
+    report['draw'] = latencies(legacy_ns)
+
+    anaglyph = vergence.Anaglyph(drawlist, size=size, pixel_size=pixel_size, mode='dynamic')
+    item = anaglyph.render(anaglyph.generate(), bg_offset)
+    anaglyph.refresh(item)
+    anaglyph.refresh(item)
+    frame_ns = np.zeros(frames, dtype=np.int64)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for i in range(frames):
+        start = perf_counter_ns()
+        anaglyph.refresh(item)
+        frame_ns[i] = perf_counter_ns() - start
+    report['bytes_held'] = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    report['refresh'] = latencies(frame_ns.tolist())
+    report['sustains_60fps'] = bool(report['refresh']['p99_ms'] < helpers.FRAME_BUDGET_MS)
+    print(f'Dynamic stereogram {size}/{pixel_size}: {report["draw"]["p50_ms"]} ms per new item, '
+          f'{report["refresh"]["p50_ms"]} ms p50 / {report["refresh"]["p99_ms"]} ms p99 per refresh, '
+          f'{report["bytes_held"]} bytes held, 60 fps: {report["sustains_60fps"]}')
+    return report
+
+def job_frames(size=300, pixel_size=3, budget_ms=jobs.FRAME_BUDGET_MS):
+    """Draws a stimulus of thousands of rectangles at once, as the prefetch worker and evaluate
+    callbacks did, and as a prefetch job run by a JobRunner in chunks under budget_ms per frame.
+    Returns the time to draw at once and the time the jobs took per frame."""
+    backend = drawing.RecordingBackend()
+    drawing.use(backend)
+    anaglyph = vergence.Anaglyph(backend.add_drawlist(width=1000, height=630), size=size, pixel_size=pixel_size,
+                                 renderer='rectangles')
+    start = perf_counter_ns()
+    anaglyph.draw()
+    report = {'size': size, 'pixel_size': pixel_size, 'budget_ms': budget_ms,
+              'at_once_ms': round((perf_counter_ns() - start) / 1e6, 1)}
+
+    runner = jobs.JobRunner()
+    queue = helpers.DrawQueue(prefetch_depth=1, generate=anaglyph.generate, render=anaglyph.render,
+                              release=anaglyph.release, render_chunks=anaglyph.render_chunks, runner=runner)
+    queue.param = 0
+    queue._submit_prefetch()
+    frame_ns = []
+    while runner.jobs:
+        start = perf_counter_ns()
+        runner.run_jobs(budget_ms)
+        frame_ns.append(perf_counter_ns() - start)
+    report['frames'] = len(frame_ns)
+    report['frame'] = latencies(frame_ns)
+    report['sustains_60fps'] = report['frame']['max_ms'] < helpers.FRAME_BUDGET_MS
+    print(f'Stimulus of {backend.created["rectangle"] // 2} rectangles: {report["at_once_ms"]} ms at once, '
+          f'as jobs {report["frames"]} frames of {report["frame"]["p50_ms"]} ms p50 / {report["frame"]["max_ms"]} ms max')
+    return report
+
+def fake_results(count):
+    """Session results as EvaluationSession.add_result would create them."""
+    drawing.use(drawing.RecordingBackend())
+    session = helpers.EvaluationSession(duration_secs=3600, count=count + 1)
+    for i in range(count):
+        session.add_result(bool(i % 3), shown_ns=1, key_ns=1 + (i % 50) * 10**7)
+    helpers.scheduler.cancel(session)
+    return session.results
+
+def session_results(count=10_000):
+    """Compares keeping count results in a list of namedtuples, as sessions used to, with
+    the ResultsBuffer. Returns the latency of an append and the memory held by each."""
+    report = {}
+    for name in ['list', 'buffer']:
+        tracemalloc.start()
+        if name == 'list':
+            results = []
+            append = lambda *values: results.append(helpers.ResultsBuffer.Result(*values))
+        else:
+            results = helpers.ResultsBuffer(min(count, 4096))
+            append = results.append
+        append_ns = []
+        for i in range(count):
+            start = perf_counter_ns()
+            append(i + 1, i % 40, bool(i % 3), 1.7e9 + i, 1.5, 0.3 + i % 50 / 100, None)
+            append_ns.append(perf_counter_ns() - start)
+        held, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report[name] = {'append': latencies(append_ns), 'bytes': held - sys.getsizeof(append_ns)}
+        del results, append
+    print(f'Session of {count} results: {report["list"]["bytes"] // 1024} -> {report["buffer"]["bytes"] // 1024} KB, '
+          f'{report["list"]["append"]["p50_ms"] * 1000:.2f} -> {report["buffer"]["append"]["p50_ms"] * 1000:.2f} us '
+          f'p50 per append')
+    return report
+
+def legacy_results_table(results):
+    """The results table as it was before it was paged: one text item per field per answer."""
+    with dpg.table(resizable=False, policy=4, scrollY=False, header_row=True):
+        for field in results.Result._fields:
+            dpg.add_table_column(width=25, width_stretch=True, label=field)
+        for record in results:
+            with dpg.table_row():
+                for value in record:
+                    dpg.add_text(value)
+
+def results_window(count=10_000):
+    """Compares building the legacy results table with building eval_results' window in a
+    dpg context without a viewport. Returns build time in ms and the number of dpg items."""
+    results = fake_results(count)
+    report = {}
+    dpg.create_context()
+    for name in ['legacy', 'paged']:
+        items = len(dpg.get_all_items())
+        start = perf_counter_ns()
+        if name == 'legacy':
+            with dpg.window():
+                legacy_results_table(results)
+        else:
+            helpers.eval_results(results)
+        report[name] = {'build_ms': round((perf_counter_ns() - start) / 1e6, 1),
+                        'items': len(dpg.get_all_items()) - items}
+    dpg.destroy_context()
+    print(f'Results window of {count} answers: {report["legacy"]["build_ms"]} -> {report["paged"]["build_ms"]} ms, '
+          f'{report["legacy"]["items"]} -> {report["paged"]["items"]} items')
+    return report
+
+def legacy_debugger(debug_data):
+    """debugger as it was before the ring buffer: prepends every line to 'txt_debug'."""
+    if drawing.active.get_value('bool_debug') == True:
+        old_data = drawing.active.get_value('txt_debug')
+        drawing.active.set_value('txt_debug', f'{debug_data}\n{old_data}')
+
+def debug_calls(calls=20_000, calls_per_frame=16):
+    """Times debugger calls with the debug window on, as the legacy string concatenation and with
+    the ring buffer, and with the window off. The ring buffer is refreshed once per calls_per_frame
+    calls, refreshes are timed separately. Returns latencies and the final length of 'txt_debug'."""
+    report = {}
+    for name in ['legacy', 'ring', 'off']:
+        drawing.use(drawing.RecordingBackend({'bool_debug': name != 'off'}))
+        helpers.debug_log = helpers.DebugLog()
+        call_ns = []
+        refresh_ns = []
+        for i in range(calls):
+            start = perf_counter_ns()
+            if name == 'legacy':
+                legacy_debugger(f'drawing {i}')
+            else:
+                helpers.debugger('drawing %s', i)
+            call_ns.append(perf_counter_ns() - start)
+            if name != 'legacy' and i % calls_per_frame == 0:
+                start = perf_counter_ns()
+                helpers.debug_log.refresh()
+                refresh_ns.append(perf_counter_ns() - start)
+        report[name] = {'call': latencies(call_ns), 'refresh': latencies(refresh_ns),
+                        'text_length': len(drawing.active.get_value('txt_debug'))}
+    print(f'debugger: {report["legacy"]["call"]["p99_ms"] * 1000:.1f} -> {report["ring"]["call"]["p99_ms"] * 1000:.1f} us '
+          f'p99 per call ({report["off"]["call"]["p99_ms"] * 1000:.1f} us with the window off), '
+          f'{report["ring"]["refresh"]["p50_ms"] * 1000:.1f} us p50 per refresh, '
+          f'{report["legacy"]["text_length"]} -> {report["ring"]["text_length"]} characters shown')
+    return report
+
+def config_loads(calls=1000):
+    """Times reading exercise_configs.yaml as the launcher used to, parsing it on every call,
+    and through the configuration module. Returns the mean time per call in us."""
+    report = {}
+    start = perf_counter_ns()
+    for _ in range(calls // 10):
+        with open(configuration.EXERCISE_CONFIG_PATH) as config_file:
+            yaml.safe_load(config_file)
+    report['parsed_us'] = round((perf_counter_ns() - start) / (calls // 10) / 1000, 1)
+    configuration.cache.clear()
+    start = perf_counter_ns()
+    configuration.exercises()
+    report['first_us'] = round((perf_counter_ns() - start) / 1000, 1)
+    start = perf_counter_ns()
+    for _ in range(calls):
+        configuration.exercises()
+    report['cached_us'] = round((perf_counter_ns() - start) / calls / 1000, 1)
+    print(f'exercise_configs.yaml: {report["parsed_us"]} us per parse, {report["first_us"]} us to parse and check, '
+          f'{report["cached_us"]} us per cached read')
+    return report
+
+def tracing_overhead(calls=100_000):
+    """Times calls of an empty function, plain and traced with tracing off and on, and an
+    empty span() block with tracing off. Returns ns per call."""
+    def plain():
+        pass
+    traced = tracing.traced('bench')(plain)
+
+    def spanned():
+        with tracing.span('bench'):
+            pass
+
+    report = {}
+    was_enabled = tracing.enabled
+    for name, func, enabled in [('plain', plain, False), ('traced_off', traced, False),
+                                ('span_off', spanned, False), ('traced_on', traced, True)]:
+        tracing.enabled = enabled
+        start = perf_counter_ns()
+        for _ in range(calls):
+            func()
+        report[name] = round((perf_counter_ns() - start) / calls, 1)
+    tracing.enabled = was_enabled
+    print(f'Tracing: {report["plain"]} ns per plain call, {report["traced_off"]} ns traced while off, '
+          f'{report["span_off"]} ns per span while off, {report["traced_on"]} ns traced while on')
+    return report
+
+def atlas_loads(runs=10):
+    """Times loading the stimulus images one texture per file as the theme used to, building
+    the atlas and reading it from its cache. Returns the mean time per load in ms."""
+    image_path = configuration.application().image_path
+    paths, key = atlas.sources(image_path)
+    report = {'images': len(paths)}
+    with tempfile.TemporaryDirectory() as scratch:
+        cache_path = str(Path(scratch, 'atlas.npz'))
+        timed = [('per_file', lambda: [dpg.load_image(str(path)) for path in paths]),
+                 ('build', lambda: atlas.build(paths)),
+                 ('cached', lambda: atlas.read_cache(cache_path, key))]
+        atlas.write_cache(cache_path, key, atlas.build(paths))
+        for name, load in timed:
+            start = perf_counter_ns()
+            for _ in range(runs):
+                load()
+            report[f'{name}_ms'] = round((perf_counter_ns() - start) / runs / 1e6, 2)
+        report['cache_bytes'] = Path(cache_path).stat().st_size
+    print(f'Stimulus atlas of {report["images"]} images: {report["per_file_ms"]} ms per file load, '
+          f'{report["build_ms"]} ms to build, {report["cached_ms"]} ms from its cache ({report["cache_bytes"] // 1024} KB)')
+    return report
+
+def result_writes(rows=5000, legacy_rows=500):
+    """Compares writing results one Answer.create at a time with the ResultWriter, both at
+    session end in batches of 100 and streamed one answer at a time. Each runs on a fresh
+    database with the same pragmas as profiles.db. Returns rows/s and the cost of queueing
+    a streamed answer."""
+    results = fake_results(rows)
+    rates = {}
+    queue_ns = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for name in ['legacy', 'batched', 'streamed']:
+            database = pw.SqliteDatabase(str(Path(tmp) / f'{name}.db'), pragmas=PRAGMAS)
+            with database.bind_ctx(PROFILE_TABLES):
+                database.create_tables(PROFILE_TABLES)
+                user = User.create(username='bench', first_name='', last_name='')
+                row_dicts = profile.result_rows(user.id, uuid4(), 'bench', 'bench', results)
+                writer = profile.ResultWriter(database)
+                start = perf_counter()
+                if name == 'legacy':
+                    session = Session.create(uuid=row_dicts[0]['session'], user=user, exercise='bench',
+                                             difficulty='bench', started=row_dicts[0]['time'])
+                    for row in row_dicts[:legacy_rows]:
+                        Answer.create(**profile.answer_row(row, session.id, session.started))
+                elif name == 'batched':
+                    for i in range(0, rows, 100):  # one batch per 100-answer session
+                        writer.add(row_dicts[i:i + 100])
+                else:
+                    for row in row_dicts:
+                        put_start = perf_counter_ns()
+                        writer.add([row])
+                        queue_ns.append(perf_counter_ns() - put_start)
+                writer.flush()
+                written = legacy_rows if name == 'legacy' else rows
+                rates[name] = round(written / (perf_counter() - start))
+                assert Answer.select().count() == written
+            database.close()
+    queue_latency = latencies(queue_ns)
+    print(f'Result writes: {rates["legacy"]} rows/s one by one, {rates["batched"]} rows/s batched, '
+          f'{rates["streamed"]} rows/s streamed, {queue_latency["p50_ms"] * 1000:.1f} us p50 to queue an answer')
+    return {'legacy_rows_per_sec': rates['legacy'], 'writer_rows_per_sec': rates['batched'],
+            'streamed_rows_per_sec': rates['streamed'], 'stream_queue': queue_latency}
+
+# the per-answer result table as it was before Session and Answer, with its indexes
+LEGACY_RESULT_TABLE = [
+    'CREATE TABLE "result" ("id" INTEGER NOT NULL PRIMARY KEY, "user_id" INTEGER NOT NULL, "session" TEXT NOT NULL, '
+    '"exercise" VARCHAR(255) NOT NULL, "difficulty" VARCHAR(255) NOT NULL, "created" DATETIME NOT NULL, '
+    '"count" INTEGER NOT NULL, "primary_param" INTEGER, "correctness" INTEGER NOT NULL, "time" REAL NOT NULL, '
+    '"time_diff" REAL NOT NULL, "reaction_time" REAL, "system_latency" REAL, '
+    'FOREIGN KEY ("user_id") REFERENCES "user" ("id"))',
+    'CREATE INDEX "result_user_id" ON "result" ("user_id")',
+    'CREATE INDEX "result_session" ON "result" ("session")',
+    'CREATE INDEX "result_user_id_exercise_created" ON "result" ("user_id", "exercise", "created")',
+]
+
+def fill_legacy_results(database, answers, users=5, exercises=6, session_answers=100):
+    """Fills the legacy result table with sessions of session_answers answers, one answer every
+    two seconds, spread over users and exercises. Uses plain executemany: inserting through
+    peewee would dominate the benchmark. Returns the user ids."""
+    users = [User.create(username=f'bench{i}', first_name='', last_name='').id for i in range(users)]
+    for statement in LEGACY_RESULT_TABLE:
+        database.execute_sql(statement)
+    start = datetime(2020, 1, 1).timestamp()
+
+    def rows():
+        for i in range(answers):
+            count = i % session_answers
+            if count == 0:
+                session = uuid4().hex
+                nth_session = i // session_answers
+                user, exercise = users[nth_session % len(users)], f'exercise{nth_session % exercises}'
+            time = start + 2 * i
+            yield (user, session, exercise, 'Entry', datetime.fromtimestamp(time).isoformat(' ', 'microseconds'),
+                   count + 1, count // 10, i % 3 > 0, time, 0 if count == 0 else 2.0,
+                   round(0.3 + (i % 97) / 1000, 6), round(0.001 + (i % 13) / 1e5, 6))
+
+    with database.atomic():
+        database.connection().executemany(
+            'INSERT INTO "result" ("user_id", "session", "exercise", "difficulty", "created", "count", '
+            '"primary_param", "correctness", "time", "time_diff", "reaction_time", "system_latency") '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', rows())
+    return users
+
+def results_history(rows=500_000, page=1000):
+    """Times get_results() on a database of the given number of answers: the first page and a
+    page deep into one exercise's history for one user, and reading that whole history page by page."""
+    timings = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        database = pw.SqliteDatabase(str(Path(tmp) / 'history.db'), pragmas=PRAGMAS)
+        with database.bind_ctx(PROFILE_TABLES):
+            database.create_tables(PROFILE_TABLES)
+            user = fill_legacy_results(database, rows)[0]
+            migrate_results()
+            start = perf_counter_ns()
+            columns, cursor = profile.get_results(user, 'exercise0', limit=page)
+            timings['first_page'] = perf_counter_ns() - start
+
+            pages = 0
+            start = perf_counter_ns()
+            while cursor:
+                page_start = perf_counter_ns()
+                columns, cursor = profile.get_results(user, 'exercise0', after=cursor, limit=page)
+                timings['last_page'] = perf_counter_ns() - page_start
+                pages += 1
+            timings['all_pages'] = perf_counter_ns() - start
+
+            start = perf_counter_ns()
+            backfill_summaries()
+            timings['backfill'] = perf_counter_ns() - start
+            start = perf_counter_ns()
+            daily = profile.get_summaries(user, 'exercise0')
+            timings['daily_summaries'] = perf_counter_ns() - start
+            start = perf_counter_ns()
+            scan = daily_scan(user, 'exercise0')
+            timings['daily_scan'] = perf_counter_ns() - start
+            assert len(scan) == len(daily['day'])
+        database.close()
+    history = {name: round(ns / 1e6, 3) for name, ns in timings.items()}
+    print(f'Results history of {rows} rows: first page {history["first_page"]} ms, last of {pages + 1} pages '
+          f'{history.get("last_page")} ms, all pages {history["all_pages"]} ms')
+    print(f'Daily history: {history["daily_summaries"]} ms from summaries, {history["daily_scan"]} ms aggregating results, '
+          f'backfill {history["backfill"]} ms')
+    return {'rows': rows, 'page_rows': page, 'pages': pages + 1, **{f'{name}_ms': ms for name, ms in history.items()}}
+
+def daily_scan(user, exercise):
+    """Accuracy per day aggregated from the answers, the way charts worked without DailySummary."""
+    day = pw.fn.DATE(Session.started + Answer.time_ms / 1000.0, 'unixepoch', 'localtime')
+    return list(Answer.select(day, pw.fn.COUNT(Answer.count), pw.fn.SUM(Answer.correctness)).join(Session)
+                      .where((Session.user == user) & (Session.exercise == exercise)).group_by(day).tuples())
+
+def database_size(database):
+    """Size of a database file in bytes, after moving the WAL into it."""
+    database.execute_sql('PRAGMA wal_checkpoint(TRUNCATE)')
+    return Path(database.database).stat().st_size
+
+def storage(answers=10_000_000, page=1000):
+    """Compares size and query times of the legacy per-answer result table with Session and Answer,
+    migrating a synthetic database in place."""
+    report = {'answers': answers}
+    with tempfile.TemporaryDirectory() as tmp:
+        database = pw.SqliteDatabase(str(Path(tmp) / 'storage.db'), pragmas=PRAGMAS)
+        with database.bind_ctx(PROFILE_TABLES):
+            database.create_tables(PROFILE_TABLES)
+            start = perf_counter()
+            user = fill_legacy_results(database, answers)[0]
+            print(f'Filled {answers} legacy results in {perf_counter() - start:.1f} s')
+
+            def timed(name, func):
+                start = perf_counter_ns()
+                result = func()
+                report[name] = round((perf_counter_ns() - start) / 1e6, 3)
+                return result
+
+            def legacy_history():
+                cursor, rows = (0, 0), 0
+                while True:
+                    page_rows = database.execute_sql(
+                        'SELECT "session", "exercise", "difficulty", "created", "count", "primary_param", "correctness", '
+                        '"time", "time_diff", "reaction_time", "system_latency", "id" FROM "result" '
+                        'WHERE "user_id" = ? AND "exercise" = ? AND ("created", "id") > (?, ?) '
+                        'ORDER BY "created", "id" LIMIT ?', (user, 'exercise0', *cursor, page)).fetchall()
+                    rows += len(page_rows)
+                    if len(page_rows) < page:
+                        return rows
+                    cursor = (page_rows[-1][3], page_rows[-1][-1])
+
+            def history():
+                cursor, rows = None, 0
+                while True:
+                    columns, cursor = profile.get_results(user, 'exercise0', after=cursor, limit=page)
+                    rows += len(columns['count'])
+                    if cursor is None:
+                        return rows
+
+            report['legacy_bytes'] = database_size(database)
+            legacy_rows = timed('legacy_history_ms', legacy_history)
+            timed('legacy_daily_scan_ms', lambda: database.execute_sql(
+                'SELECT DATE("created"), COUNT("id"), SUM("correctness") FROM "result" '
+                'WHERE "user_id" = ? AND "exercise" = ? GROUP BY DATE("created")', (user, 'exercise0')).fetchall())
+
+            timed('migration_ms', migrate_results)
+            report['bytes'] = database_size(database)
+            assert timed('history_ms', history) == legacy_rows
+            timed('daily_scan_ms', lambda: daily_scan(user, 'exercise0'))
+        database.close()
+
+    print(f'Storage of {answers} answers: {report["legacy_bytes"] / answers:.1f} -> {report["bytes"] / answers:.1f} bytes per answer, '
+          f'{report["legacy_bytes"] / 2**20:.0f} -> {report["bytes"] / 2**20:.0f} MB, migrated in {report["migration_ms"] / 1000:.1f} s')
+    print(f'History of {legacy_rows} answers: {report["legacy_history_ms"]} -> {report["history_ms"]} ms paged, '
+          f'{report["legacy_daily_scan_ms"]} -> {report["daily_scan_ms"]} ms per day')
+    return report
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, path):
+    """Prints the change in draw p50 per configuration relative to an earlier results file."""
+    with open(path) as previous_file:
+        previous = json.load(previous_file)['exercises']
+    print(f'\nCompared to {path}:')
+    for key, result in results.items():
+        if key not in previous:
+            continue
+        old = previous[key]['latency']['draw']['p50_ms']
+        new = result['latency']['draw']['p50_ms']
+        change = (new - old) / old * 100 if old else 0
+        print(f'{key:<32} draw p50 {old:>9.3f} -> {new:>9.3f} ms ({change:+.1f}%)')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m vizier bench', description='Vizier benchmarks.')
+    parser.add_argument('--trials', type=int, default=100, help='trials per configuration')
+    parser.add_argument('--output', default='bench_results.json', help='JSON file to write results to')
+    parser.add_argument('--compare', help='earlier JSON results file to compare with')
+    parser.add_argument('--memory', action='store_true', help='only run the anaglyph memory benchmark')
+    parser.add_argument('--trace', metavar='PATH', help='write a Chrome trace of the exercise trials to PATH')
+    parser.add_argument('--storage', type=int, metavar='ANSWERS', nargs='?', const=10_000_000,
+                        help='only compare result storage schemas on this many synthetic answers (default 10M)')
+    args = parser.parse_args(argv)
+
+    if args.memory:
+        anaglyph_memory()
+        return
+    if args.storage:
+        storage(args.storage)
+        return
+
+    if args.trace:
+        tracing.enable()
+    results = exercises(args.trials)
+    if args.trace:
+        tracing.disable()
+        print(f'{tracing.export(args.trace)} spans written to {args.trace}')
+    overhead = tracing_overhead()
+    smooth = smooth_frames()
+    dynamic = dynamic_frames()
+    chunked = job_frames()
+    config = config_loads()
+    images = atlas_loads()
+    session = session_results()
+    window = results_window()
+    debug = debug_calls()
+    persistence = result_writes()
+    history = results_history()
+    report = {
+        'vizier': __version__,
+        'commit': git_commit(),
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'trials': args.trials,
+        'exercises': results,
+        'smooth_vergence': smooth,
+        'dynamic_stereogram': dynamic,
+        'jobs': chunked,
+        'session_results': session,
+        'results_window': window,
+        'debugger': debug,
+        'tracing': overhead,
+        'configuration': config,
+        'atlas': images,
+        'persistence': persistence,
+        'history': history,
+    }
+    with open(args.output, 'w') as output_file:
+        json.dump(report, output_file, indent=2)
+    print(f'Results written to {args.output}')
+    if args.compare:
+        compare(results, args.compare)
+
+if __name__ == '__main__':
+    main()
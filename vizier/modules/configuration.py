@@ -0,0 +1,201 @@
+"""Module containing the configuration of Vizier.
+
+config.yaml and exercise_configs.yaml are read through this module only. Each file is
+parsed and checked against its schema once, and parsed again only when its modification
+time or size changes. The configuration is handed out as namedtuples and read-only
+mappings, so callers cannot change the cached copy.
+"""
+
+import hashlib
+import json
+import os
+import yaml
+from collections import namedtuple
+from types import MappingProxyType
+
+CONFIG_PATH = './vizier/config/config.yaml'
+EXERCISE_CONFIG_PATH = './vizier/config/exercise_configs.yaml'
+
+NUMBER = (int, float)
+LOG_LEVELS = {'DEBUG', 'INFO', 'WARNING', 'ERROR'}
+
+# schemas map keys to a type, a tuple of types or a set of allowed values
+# 'application' in config.yaml, with the default of every key
+APPLICATION_SCHEMA = {
+    'NOTIMP_exercise_config_path': (str, EXERCISE_CONFIG_PATH),
+    'debug': (bool, False),
+    'hidpi': (bool, True),
+    'log_level': (LOG_LEVELS, 'INFO'),
+    'image_path': (str, './vizier/assets/images/'),
+    'profile_db_path': (str, './vizier/userdata/profiles.db'),
+    'trace': (bool, False),
+    'trace_path': (str, './vizier/userdata/trace.json'),
+    'job_budget_ms': (NUMBER, 4),
+}
+
+# 'Session' of a configuration, passed to EvaluationSession
+SESSION_SCHEMA = {
+    'primary_param_init': int,
+    'step': int,
+    'success_threshold': int,
+    'fail_threshold': int,
+    'count': int,
+    'duration_secs': NUMBER,
+}
+
+# 'Exercise' of a configuration per plugin, passed to the exercise class
+EXERCISE_SCHEMAS = {
+    'vergence': {
+        'bg_offset': int,
+        'focal_offset': int,
+        'size': int,
+        'pixel_size': int,
+        'focal_size_rel': NUMBER,
+        'renderer': {'texture', 'rectangles'},
+        'prefetch_depth': int,
+        'mode': {'steps', 'smooth', 'dynamic'},
+        'ramp_deg_per_sec': NUMBER,
+        'viewing_distance_cm': NUMBER,
+        'pixels_per_cm': NUMBER,
+    },
+    'recognition': {
+        'object_type': str,
+        'object_count': int,
+        'object_size': NUMBER,
+        'display_delay_secs': NUMBER,
+        'display_time_secs': NUMBER,
+    },
+    'depth_perception': {
+        'object_type': str,
+        'object_count': int,
+        'object_size': NUMBER,
+        'min_depth': NUMBER,
+        'max_depth': NUMBER,
+        'min_depth_diff': NUMBER,
+        'max_depth_diff': NUMBER,
+        'display_delay_secs': NUMBER,
+    },
+    'alignment': {
+        'object_size': NUMBER,
+        'randomness': NUMBER,
+    },
+}
+
+Application = namedtuple('Application', APPLICATION_SCHEMA)
+Exercise = namedtuple('Exercise', ['name', 'plugin', 'configurations'])
+# session: Session values plus exercise, difficulty and config_hash, as EvaluationSession takes them
+# exercise_params: Exercise values
+Configuration = namedtuple('Configuration', ['exercise', 'difficulty', 'plugin', 'session', 'exercise_params',
+                                             'config_hash'])
+
+class ConfigError(ValueError):
+    """A configuration file does not match its schema.
+
+    :attr errors: list of problems, each starting with the path of the offending key.
+    """
+    def __init__(self, path, errors):
+        self.errors = errors
+        super().__init__(f'{path} is invalid:\n' + '\n'.join(errors))
+
+def problem(where, value, expected):
+    """Returns what is wrong with value, or None."""
+    if isinstance(expected, set):
+        if value not in expected:
+            return f'{where}: {value!r} is not one of {", ".join(sorted(expected))}'
+    # bools are ints to python, but not to a config file
+    elif isinstance(value, bool) and bool not in (expected if isinstance(expected, tuple) else (expected,)):
+        return f'{where}: expected a number, got {value!r}'
+    elif not isinstance(value, expected):
+        names = ' or '.join(t.__name__ for t in (expected if isinstance(expected, tuple) else (expected,)))
+        return f'{where}: expected {names}, got {value!r}'
+
+def check(where, values, schema, errors):
+    """Checks a mapping against a schema. Adds problems to errors."""
+    if not isinstance(values, dict):
+        errors.append(f'{where}: expected a mapping, got {values!r}')
+        return
+    for key, value in values.items():
+        if key not in schema:
+            errors.append(f'{where}: unknown key {key!r}, expected one of {", ".join(schema)}')
+        else:
+            error = problem(f'{where}/{key}', value, schema[key])
+            if error:
+                errors.append(error)
+
+def parse_application(raw, path):
+    errors = []
+    application = raw.get('application') if isinstance(raw, dict) else None
+    check('application', application, {key: expected for key, (expected, _) in APPLICATION_SCHEMA.items()}, errors)
+    if errors:
+        raise ConfigError(path, errors)
+    return Application(**{key: application.get(key, default) for key, (_, default) in APPLICATION_SCHEMA.items()})
+
+def parse_exercises(raw, path):
+    errors = []
+    exercises = raw.get('Exercises') if isinstance(raw, dict) else None
+    if not isinstance(exercises, dict):
+        raise ConfigError(path, [f'Exercises: expected a mapping, got {exercises!r}'])
+    parsed = []
+    for name, exercise in exercises.items():
+        where = f'Exercises/{name}'
+        check(where, exercise, {'Plugin': set(EXERCISE_SCHEMAS), 'Configurations': dict}, errors)
+        if not isinstance(exercise, dict):
+            continue
+        plugin = exercise.get('Plugin')
+        configurations = []
+        for difficulty, config in (exercise.get('Configurations') or {}).items():
+            config_where = f'{where}/Configurations/{difficulty}'
+            check(config_where, config, {'Session': dict, 'Exercise': dict}, errors)
+            if not isinstance(config, dict):
+                continue
+            if 'Session' not in config:
+                errors.append(f'{config_where}: missing Session')
+            session = config.get('Session') or {}
+            exercise_params = config.get('Exercise') or {}
+            if isinstance(session, dict):
+                check(f'{config_where}/Session', session, SESSION_SCHEMA, errors)
+            if isinstance(exercise_params, dict) and plugin in EXERCISE_SCHEMAS:
+                check(f'{config_where}/Exercise', exercise_params, EXERCISE_SCHEMAS[plugin], errors)
+            if errors:
+                continue
+            # the hash of the configuration identifies it in stored sessions
+            config_hash = hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:16]
+            session = dict(session, exercise=name, difficulty=difficulty, config_hash=config_hash)
+            configurations.append(Configuration(name, difficulty, plugin, MappingProxyType(session),
+                                                MappingProxyType(dict(exercise_params)), config_hash))
+        parsed.append(Exercise(name, plugin, tuple(configurations)))
+    if errors:
+        raise ConfigError(path, errors)
+    return tuple(parsed)
+
+# path: ((modification time, size), parsed configuration)
+cache = {}
+
+def load(path, parse):
+    """Returns the parsed contents of a yaml file, parsing it only if it changed since the last call."""
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = cache.get(path)
+    if cached is None or cached[0] != version:
+        with open(path) as config_file:
+            raw = yaml.safe_load(config_file)
+        cached = (version, parse(raw, path))
+        cache[path] = cached
+    return cached[1]
+
+def application(path=CONFIG_PATH):
+    """The 'application' part of config.yaml as an Application namedtuple."""
+    return load(path, parse_application)
+
+def exercises(path=EXERCISE_CONFIG_PATH):
+    """The exercises in exercise_configs.yaml as a tuple of Exercise namedtuples."""
+    return load(path, parse_exercises)
+
+def save_application(values, path=CONFIG_PATH):
+    """Checks and writes new 'application' values to config.yaml. Returns the Application."""
+    raw = {'application': dict(values)}
+    saved = parse_application(raw, path)
+    with open(path, 'w') as config_file:
+        yaml.safe_dump(raw, config_file)
+    cache.pop(path, None)
+    return saved
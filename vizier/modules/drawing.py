@@ -0,0 +1,220 @@
+"""Module containing drawing backends for Vizier.
+
+Exercises draw through a backend instead of calling dpg directly. DpgBackend draws
+with DearPyGui. RecordingBackend keeps the primitives in a dict, so exercises can run,
+be tested and benchmarked without a viewport or even a dpg context.
+
+The methods mirror the dpg functions they replace. Draw functions always take an
+explicit parent: backends have no container stack.
+
+Node wraps a draw node that is moved and scaled with a transform instead of being
+deleted and drawn again, so moving it costs the same however much it contains.
+"""
+
+import dearpygui.dearpygui as dpg
+import numpy as np
+from collections import Counter, defaultdict
+from itertools import count
+
+class DpgBackend():
+    """Draws with DearPyGui. Needs a dpg context."""
+    interactive = True
+
+    def generate_uuid(self):
+        return dpg.generate_uuid()
+
+    def get_value(self, tag):
+        return dpg.get_value(tag)
+
+    def set_value(self, tag, value):
+        dpg.set_value(tag, value)
+
+    def get_item_width(self, item):
+        return dpg.get_item_width(item)
+
+    def get_item_height(self, item):
+        return dpg.get_item_height(item)
+
+    def draw_node(self, parent, tag=0, show=True):
+        return dpg.add_draw_node(tag=tag, parent=parent, show=show)
+
+    def draw_rectangle(self, pmin, pmax, parent, color=(255, 255, 255), fill=(0, 0, 0, -255), thickness=1.0):
+        return dpg.draw_rectangle(pmin, pmax, parent=parent, color=color, fill=fill, thickness=thickness)
+
+    def draw_circle(self, center, radius, parent, color=(255, 255, 255), fill=(0, 0, 0, -255), thickness=1.0):
+        return dpg.draw_circle(center, radius, parent=parent, color=color, fill=fill, thickness=thickness)
+
+    def draw_quad(self, p1, p2, p3, p4, parent, color=(255, 255, 255), fill=(0, 0, 0, -255), thickness=1.0):
+        return dpg.draw_quad(p1, p2, p3, p4, parent=parent, color=color, fill=fill, thickness=thickness)
+
+    def draw_image(self, texture, pmin, pmax, parent, uv_min=(0.0, 0.0), uv_max=(1.0, 1.0)):
+        return dpg.draw_image(texture, pmin=pmin, pmax=pmax, parent=parent, uv_min=uv_min, uv_max=uv_max)
+
+    def add_dynamic_texture(self, width, height, data):
+        return dpg.add_dynamic_texture(width, height, data, parent='textures')
+
+    def add_static_texture(self, width, height, data):
+        return dpg.add_static_texture(width, height, data, parent='textures')
+
+    def apply_transform(self, item, offset=(0.0, 0.0), scale=(1.0, 1.0), origin=(0.0, 0.0)):
+        """Translates the contents of a draw node by offset, after scaling them by scale around origin."""
+        transform = dpg.create_translation_matrix(offset)
+        if scale != (1.0, 1.0):
+            transform = (transform * dpg.create_translation_matrix(origin)
+                         * dpg.create_scale_matrix(scale) * dpg.create_translation_matrix([-v for v in origin]))
+        dpg.apply_transform(item, transform)
+
+    def show_item(self, item):
+        dpg.show_item(item)
+
+    def hide_item(self, item):
+        dpg.hide_item(item)
+
+    def delete_item(self, item, children_only=False):
+        dpg.delete_item(item, children_only=children_only)
+
+    def does_item_exist(self, item):
+        return dpg.does_item_exist(item)
+
+class RecordingBackend():
+    """Records primitives instead of drawing them.
+
+    :attr items: dict of tag: {'type', 'parent', 'show', 'args'} for every living item.
+    :attr created: Counter of the number of items created per type.
+    :attr transforms: number of transforms applied.
+    :attr values: dict standing in for the dpg value registry.
+    """
+    interactive = False
+
+    def __init__(self, values=None):
+        self.uuids = count(1)
+        self.items = {}
+        self.child_tags = defaultdict(list)
+        self.created = Counter()
+        self.transforms = 0
+        self.values = {
+            'color_left': [0.0, 38.0, 230.0, 100.0],
+            'color_right': [255.0, 25.0, 25.0, 50.0],
+            'bool_debug': False,
+            'txt_debug': '',
+        }
+        self.values.update(values or {})
+
+    def _add(self, type_, parent=None, tag=0, show=True, **args):
+        tag = tag or self.generate_uuid()
+        self.items[tag] = {'type': type_, 'parent': parent, 'show': show, 'args': args}
+        self.child_tags[parent].append(tag)
+        self.created[type_] += 1
+        return tag
+
+    def add_drawlist(self, width, height):
+        """Stands in for the drawlist an exercise window would contain."""
+        return self._add('drawlist', width=width, height=height)
+
+    def children(self, item):
+        return list(self.child_tags.get(item, []))
+
+    def generate_uuid(self):
+        return next(self.uuids)
+
+    def get_value(self, tag):
+        return self.values.get(tag)
+
+    def set_value(self, tag, value):
+        self.values[tag] = value
+
+    def get_item_width(self, item):
+        return self.items[item]['args']['width']
+
+    def get_item_height(self, item):
+        return self.items[item]['args']['height']
+
+    def draw_node(self, parent, tag=0, show=True):
+        return self._add('draw_node', parent, tag, show)
+
+    def draw_rectangle(self, pmin, pmax, parent, color=(255, 255, 255), fill=(0, 0, 0, -255), thickness=1.0):
+        return self._add('rectangle', parent, pmin=pmin, pmax=pmax, color=color, fill=fill, thickness=thickness)
+
+    def draw_circle(self, center, radius, parent, color=(255, 255, 255), fill=(0, 0, 0, -255), thickness=1.0):
+        return self._add('circle', parent, center=center, radius=radius, color=color, fill=fill, thickness=thickness)
+
+    def draw_quad(self, p1, p2, p3, p4, parent, color=(255, 255, 255), fill=(0, 0, 0, -255), thickness=1.0):
+        return self._add('quad', parent, points=(p1, p2, p3, p4), color=color, fill=fill, thickness=thickness)
+
+    def draw_image(self, texture, pmin, pmax, parent, uv_min=(0.0, 0.0), uv_max=(1.0, 1.0)):
+        return self._add('image', parent, texture=texture, pmin=pmin, pmax=pmax, uv_min=uv_min, uv_max=uv_max)
+
+    def add_dynamic_texture(self, width, height, data):
+        # like dpg, keep a copy: callers may reuse their buffer
+        return self._add('texture', width=width, height=height, data=np.array(data, dtype=np.float32))
+
+    def add_static_texture(self, width, height, data):
+        return self._add('static_texture', width=width, height=height, data=np.array(data, dtype=np.float32))
+
+    def apply_transform(self, item, offset=(0.0, 0.0), scale=(1.0, 1.0), origin=(0.0, 0.0)):
+        self.items[item]['transform'] = {'offset': offset, 'scale': scale, 'origin': origin}
+        self.transforms += 1
+
+    def show_item(self, item):
+        self.items[item]['show'] = True
+
+    def hide_item(self, item):
+        self.items[item]['show'] = False
+
+    def delete_item(self, item, children_only=False):
+        for child in self.child_tags.pop(item, []):
+            self.delete_item(child)
+        if not children_only and item in self.items:
+            siblings = self.child_tags.get(self.items.pop(item)['parent'])
+            if siblings:
+                siblings.remove(item)
+
+    def does_item_exist(self, item):
+        return item in self.items
+
+class Node():
+    """A draw node that is moved and scaled by a transform, keeping what is drawn in it.
+
+    Draw the contents once with node.tag as parent, at the place they have at offset (0, 0).
+
+    :param origin: the point scale() scales around, in drawlist coordinates.
+    """
+    def __init__(self, parent, tag=0, show=True, origin=(0.0, 0.0), backend=None):
+        self.backend = backend or active
+        self.tag = self.backend.draw_node(parent, tag=tag, show=show)
+        self.origin = tuple(origin)
+        self.offset = (0.0, 0.0)
+        self.scale_factor = (1.0, 1.0)
+
+    def apply(self):
+        self.backend.apply_transform(self.tag, self.offset, self.scale_factor, self.origin)
+
+    def move_to(self, x, y):
+        """Places the contents offset by (x, y) from where they were drawn."""
+        self.offset = (float(x), float(y))
+        self.apply()
+
+    def move_by(self, dx, dy):
+        self.move_to(self.offset[0] + dx, self.offset[1] + dy)
+
+    def scale(self, x, y=None):
+        """Scales the contents around origin. y defaults to x."""
+        self.scale_factor = (float(x), float(x if y is None else y))
+        self.apply()
+
+    def show(self):
+        self.backend.show_item(self.tag)
+
+    def hide(self):
+        self.backend.hide_item(self.tag)
+
+    def delete(self):
+        self.backend.delete_item(self.tag)
+
+# the backend used by the application and the helpers module
+active = DpgBackend()
+
+def use(backend):
+    """Switch the backend used by helpers and newly created exercises."""
+    global active
+    active = backend
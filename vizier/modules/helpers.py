@@ -2,20 +2,35 @@
 
 import dearpygui.dearpygui as dpg
 from contextlib import contextmanager
-from time import time, sleep
-from threading import Thread
-from collections import namedtuple
+from time import time, perf_counter_ns
+from threading import Thread, Lock, Condition
+from collections import namedtuple, deque
 from pathlib import Path
+from uuid import uuid4
+import heapq
 import importlib
+from itertools import count
 import pkgutil
 import yaml
 import logging
+import numpy as np
 from .theme import COLORS, SAFE_COLORS_TOL, SAFE_COLORS_WONG
 from . import profile
+from . import drawing
+from . import tracing
 
-logging.basicConfig(format='%(levelname)s:%(message)s', level=logging.DEBUG)
 fixed_window = {'no_title_bar': True, 'menubar': False, 'no_resize': True, 'no_move': True}
 
+# recent system latencies in ms, shown as a histogram in the debug window
+system_latencies = deque(maxlen=500)
+
+# lines of debug output kept for the debug window
+DEBUG_LOG_LINES = 200
+
+# frame time at 60 fps, and the number of frame times FrameStats keeps (10 minutes at 60 fps)
+FRAME_BUDGET_MS = 1000 / 60
+FRAME_STATS_CAPACITY = 36_000
+
 class Answers():
     """Keeps a temporary record of given answers. This is useful in cases when a series of answers needs to be evaluated by the evaluation logic. For instance, when showing multiple arrows that need to be recalled in the correct order."""
 
@@ -34,16 +49,153 @@ class Answers():
     def reset(self):
         self.answers = []
 
+class ScheduledCall():
+    """Handle to a call made by the Scheduler. A call that has already started is not interrupted by cancel()."""
+    def __init__(self, due_ns, func, args, owner, background=False):
+        self.due_ns = due_ns
+        self.func = func
+        self.args = args
+        self.owner = owner
+        self.background = background
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+class Scheduler():
+    """Runs functions after a delay, all on a single timer thread.
+
+    Calls can belong to an owner, like the tag of a draw_node or an EvaluationSession.
+    cancel(owner) cancels all pending calls of that owner.
+
+    With dispatch set, due calls are handed to dispatch(run, call) instead of being run on
+    the timer thread, see jobs.JobRunner.post(). Calls made with background=True still
+    run on the timer thread.
+    """
+    def __init__(self):
+        self.pending = []   # heap of (due_ns, sequence number, ScheduledCall)
+        self.sequence = count()
+        self.changed = Condition()
+        self.thread = None
+        self.dispatch = None
+        self.dispatched = set()     # calls handed to dispatch that have not run yet
+
+    def call_later(self, delay_secs, func, *args, owner=None, background=False):
+        """Call func(*args) after delay_secs. Returns a ScheduledCall.
+
+        :param background: run on the timer thread even with dispatch set, for work that does not touch the UI.
+        """
+        call = ScheduledCall(perf_counter_ns() + int(delay_secs * 1e9), func, args, owner, background)
+        with self.changed:
+            heapq.heappush(self.pending, (call.due_ns, next(self.sequence), call))
+            if self.thread is None:
+                self.thread = Thread(target=self._run, name='scheduler', daemon=True)
+                self.thread.start()
+            self.changed.notify()
+        return call
+
+    def cancel(self, owner):
+        """Cancel all pending calls belonging to owner."""
+        if owner is None:
+            return
+        with self.changed:
+            for call in [call for _, _, call in self.pending] + list(self.dispatched):
+                if call.owner == owner:
+                    call.cancel()
+
+    def _run(self):
+        while True:
+            with self.changed:
+                while True:
+                    while self.pending and self.pending[0][2].cancelled:
+                        heapq.heappop(self.pending)
+                    if not self.pending:
+                        self.changed.wait()
+                        continue
+                    wait_ns = self.pending[0][0] - perf_counter_ns()
+                    if wait_ns <= 0:
+                        break
+                    self.changed.wait(wait_ns / 1e9)
+                _, _, call = heapq.heappop(self.pending)
+                dispatch = self.dispatch and not call.background
+                if dispatch:
+                    self.dispatched.add(call)
+            if dispatch:
+                self.dispatch(self.run, call)
+            else:
+                self.run(call)
+
+    def run(self, call):
+        """Runs a due call unless it was cancelled, also after it was dispatched."""
+        with self.changed:
+            self.dispatched.discard(call)
+        if call.cancelled:
+            return
+        try:
+            call.func(*call.args)
+        except Exception:
+            logging.exception(f'Scheduled call to {call.func.__name__} failed')
+
+scheduler = Scheduler()
+
+def show_if_exists(item):
+    """Show an item unless it was deleted in the meantime."""
+    if drawing.active.does_item_exist(item):
+        drawing.active.show_item(item)
+
+def hide_if_exists(item):
+    """Hide an item unless it was deleted in the meantime."""
+    if drawing.active.does_item_exist(item):
+        drawing.active.hide_item(item)
+
 class DrawQueue():
     """Queue, show and delete draw_nodes.
 
     The queue must be fed a tuple containing at least a string referring to a dpg draw_node tag.
     Optionally the tuple can contain a 'display_time_secs' attribute. This will be used to
     hide the indicated dpg draw_node after a give amount of seconds.
+    Timers run on the scheduler and are cancelled when the draw_node is deleted.
+    A 'texture_uuid' attribute refers to a texture used only by this draw_node. The texture
+    is deleted together with the draw_node.
+    A 'timeline' attribute holds (offset_secs, tag) pairs of hidden child items. These are
+    shown by the scheduler, offset_secs after the draw_node is shown. The display time
+    starts once the last child is shown.
+
+    With a prefetch_depth above 0, that many items are kept drawn ahead of time. With a
+    runner, they are drawn by jobs on the render thread, see the jobs module, and so are
+    the items add_prefetched() finds no prefetched item for. Otherwise a worker thread
+    draws them.
+    :param prefetch_depth: number of items to keep ready.
+    :param generate: function returning the random parts of a frame, independent of any parameter.
+    :param render: function taking a frame and a parameter, returning a hidden item tuple.
+    :param release: optional function taking a frame that will not be rendered again.
+    :param render_chunks: optional generator version of render, yielding between chunks of drawing.
+    :param runner: jobs.JobRunner to prefetch with.
     """
-    def __init__(self):
+    def __init__(self, prefetch_depth=0, generate=None, render=None, release=None, render_chunks=None,
+                 runner=None):
         self.queue = []
         self.current_item = None
+        self.shown_ns = None    # perf_counter_ns() at which the current item was shown, timeline included
+        self.prefetch_depth = prefetch_depth
+        self.generate = generate
+        self.render = render
+        self.release = release or (lambda frame: None)
+        self.prefetched = []    # (frame, item_tuple) rendered with self.param
+        self.stale_frames = []  # frames whose items were rendered with an old param
+        self.param = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+        self.render_lock = Lock()       # generate and render are never run concurrently
+        self.pool_changed = Condition()
+        self.render_chunks = render_chunks
+        self.runner = runner
+        self.jobs = []      # prefetch jobs that have not finished
+        self.waiting = []   # jobs drawing items for add_prefetched(), in order
+        self.active = prefetch_depth > 0
+        if self.active and runner is None:
+            Thread(target=self._prefetch_worker, daemon=True).start()
 
     def __repr__(self):
         summary = f'Queued: {self.queue}\nCurrent item: {self.current_item}'
@@ -53,28 +205,272 @@ class DrawQueue():
         """Add a tag for a dpg item to the queue."""
         self.queue.append(item_tuple)
 
+    def add_prefetched(self, param, on_ready=None):
+        """Add an item drawn with the given parameter to the queue, then call on_ready().
+        Takes a prefetched item when one is ready. Otherwise one is drawn: with a runner as a
+        job, so on_ready() is called in a later frame, without one right away."""
+        with self.pool_changed:
+            if param != self.param:
+                # items drawn with the old param are useless, but their frames can be redrawn.
+                # Jobs in progress finish and are discarded by _prefetched()
+                for frame, item_tuple in self.prefetched:
+                    self.stale_frames.append(frame)
+                    self.delete(item_tuple)
+                self.invalidated += len(self.prefetched)
+                self.prefetched = []
+                self.param = param
+            if self.prefetched:
+                frame, item_tuple = self.prefetched.pop(0)
+                self.release(frame)
+                self.hits += 1
+            else:
+                item_tuple = None
+                self.misses += 1
+            self.pool_changed.notify_all()
+        drawing.active.set_value('txt_prefetch_stats', \
+                      f'Prefetch hits: {self.hits} misses: {self.misses} invalidated: {self.invalidated}')
+
+        if self.runner and (item_tuple is None or self.waiting):
+            # drawn after the jobs in progress, which share the state of the renderer.
+            # A ready item also waits for the items drawn before it, to keep the order
+            job = self._prefetch_job(param) if item_tuple is None else self._ready_job(item_tuple)
+            handle = self.runner.submit(job, owner=self)
+            handle.on_done = lambda result, handle=handle: self._drawn(handle, result, on_ready)
+            self.waiting.append(handle)
+            self._submit_prefetch()
+            return
+        if item_tuple is None:
+            with self.render_lock:
+                frame = self.generate()
+                item_tuple = self.render(frame, param)
+                self.release(frame)
+        self.add(item_tuple)
+        self._submit_prefetch()
+        if on_ready:
+            on_ready()
+
+    def _ready_job(self, item_tuple):
+        """Job returning an item that is drawn already."""
+        return None, item_tuple
+        yield
+
+    def _drawn(self, handle, result, on_ready):
+        """Queues an item add_prefetched() waited for."""
+        frame, item_tuple = result
+        self.waiting.remove(handle)
+        if frame is not None:
+            self.release(frame)
+        self.add(item_tuple)
+        if on_ready:
+            on_ready()
+
+    def _submit_prefetch(self):
+        """Submits prefetch jobs until prefetch_depth items are ready or being drawn."""
+        # drop failed jobs
+        self.jobs = [handle for handle in self.jobs if not handle.done]
+        self.waiting = [handle for handle in self.waiting if not handle.done]
+        while self.runner and self.active and len(self.prefetched) + len(self.jobs) < self.prefetch_depth:
+            param = self.param
+            handle = self.runner.submit(self._prefetch_job(param), owner=self)
+            handle.on_done = lambda result, handle=handle, param=param: self._prefetched(handle, param, result)
+            self.jobs.append(handle)
+
+    @tracing.traced_chunks()
+    def _prefetch_job(self, param):
+        frame = self.stale_frames.pop(0) if self.stale_frames else self.generate()
+        yield
+        if self.render_chunks:
+            item_tuple = yield from self.render_chunks(frame, param)
+        else:
+            item_tuple = self.render(frame, param)
+        return frame, item_tuple
+
+    def _prefetched(self, handle, param, result):
+        """Keeps the item drawn by a prefetch job, unless the param changed while it was drawn."""
+        frame, item_tuple = result
+        self.jobs.remove(handle)
+        if self.active and param == self.param:
+            self.prefetched.append((frame, item_tuple))
+        else:
+            self.stale_frames.append(frame)
+            self.delete(item_tuple)
+        self._submit_prefetch()
+
+    def _prefetch_worker(self):
+        """Keeps prefetch_depth items drawn with the current param."""
+        while True:
+            with self.pool_changed:
+                while self.active and (self.param is None or len(self.prefetched) >= self.prefetch_depth):
+                    self.pool_changed.wait()
+                if not self.active:
+                    return
+                param = self.param
+                frame = self.stale_frames.pop(0) if self.stale_frames else None
+
+            with self.render_lock:
+                if not self.active:
+                    return
+                if frame is None:
+                    frame = self.generate()
+                item_tuple = self.render(frame, param)
+
+                with self.pool_changed:
+                    if self.active and param == self.param:
+                        self.prefetched.append((frame, item_tuple))
+                    else:
+                        self.stale_frames.append(frame)
+                        self.delete(item_tuple)
+
+    def close(self):
+        """Stop prefetching and delete all items held by the queue."""
+        with self.pool_changed:
+            self.active = False
+            self.pool_changed.notify_all()
+        if self.runner:
+            # the items of unfinished jobs are deleted with the drawlist
+            self.runner.cancel(self)
+            self.jobs = []
+            self.waiting = []
+        with self.render_lock:     # wait for a render in progress
+            items = [item for _, item in self.prefetched] + self.queue
+            if self.current_item:
+                items.append(self.current_item)
+            for item_tuple in items:
+                if drawing.active.does_item_exist(item_tuple.node_uuid):
+                    self.delete(item_tuple)
+            self.prefetched = []
+            self.queue = []
+            self.current_item = None
+
+    @tracing.traced()
     def remove(self):
         """Remove current dpg item from the queue."""
-        dpg.delete_item(self.current_item.node_uuid)
+        self.delete(self.current_item)
         self.current_item = None
 
+    def delete(self, item_tuple):
+        """Delete the dpg draw_node and texture belonging to an item."""
+        scheduler.cancel(item_tuple.node_uuid)
+        drawing.active.delete_item(item_tuple.node_uuid)
+        if getattr(item_tuple, 'texture_uuid', None) and drawing.active.does_item_exist(item_tuple.texture_uuid):
+            drawing.active.delete_item(item_tuple.texture_uuid)
+
+    @tracing.traced()
     def next(self):
         """Unhides current node, deletes previous node."""
         queued_item = self.queue.pop(0)
-        dpg.show_item(queued_item.node_uuid)
+        drawing.active.show_item(queued_item.node_uuid)
+        timeline = getattr(queued_item, 'timeline', [])
+        reveal_secs = 0
+        for offset_secs, tag in timeline:
+            scheduler.call_later(offset_secs, show_if_exists, tag, owner=queued_item.node_uuid)
+            reveal_secs = max(reveal_secs, offset_secs)
+        if timeline:
+            # shown once the last child is, the call is scheduled after the children
+            self.shown_ns = None
+            scheduler.call_later(reveal_secs, self._revealed, queued_item.node_uuid, owner=queued_item.node_uuid)
+        else:
+            self.shown_ns = perf_counter_ns()
         if hasattr(queued_item, 'display_time_secs'):
-            debugger(f'Displaying for {queued_item.display_time_secs}')
-            timer = Thread(target=self.display_timer, \
-                           args=(queued_item.node_uuid, queued_item.display_time_secs))
-            timer.start()
+            debugger('Displaying for %s', queued_item.display_time_secs)
+            scheduler.call_later(reveal_secs + queued_item.display_time_secs, hide_if_exists,
+                                 queued_item.node_uuid, owner=queued_item.node_uuid)
         if self.current_item:
-            dpg.delete_item(self.current_item.node_uuid)
+            self.delete(self.current_item)
         self.current_item = queued_item
 
-    def display_timer(self, node_uuid, secs):
-        sleep(secs)
-        dpg.hide_item(node_uuid)
-    
+    def _revealed(self, node_uuid):
+        """Sets shown_ns once the timeline of the current item is shown."""
+        if self.current_item and self.current_item.node_uuid == node_uuid:
+            self.shown_ns = perf_counter_ns()
+
+class ResultsBuffer():
+    """Results of a session in a numpy structured array that grows as needed.
+
+    column() returns a column as a view, without copying. Indexing and iterating return
+    Result namedtuples of python values, with None for missing latencies.
+    :param capacity: number of results to allocate room for up front.
+    """
+    __slots__ = ('data', 'size')
+    dtype = np.dtype([('count', np.int32), ('primary_param', np.int32), ('correctness', np.bool_),
+                      ('time', np.float64), ('time_diff', np.float64),
+                      ('reaction_time', np.float64), ('system_latency', np.float64)])
+    Result = namedtuple('Result', dtype.names)
+
+    def __init__(self, capacity=64):
+        self.data = np.zeros(max(capacity, 1), dtype=self.dtype)
+        self.size = 0
+
+    def append(self, *values):
+        """Add a result. Missing (None) latencies are stored as nan."""
+        if self.size == len(self.data):
+            data = np.zeros(2 * len(self.data), dtype=self.dtype)
+            data[:self.size] = self.data
+            self.data = data
+        self.data[self.size] = values
+        self.size += 1
+
+    def set(self, index, name, value):
+        self.data[name][range(self.size)[index]] = value
+
+    def column(self, name):
+        return self.data[name][:self.size]
+
+    @property
+    def array(self):
+        """All results as a structured array view."""
+        return self.data[:self.size]
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(self.size)[index]]
+        record = self.Result(*self.data[range(self.size)[index]].item())
+        return record._replace(reaction_time=None if np.isnan(record.reaction_time) else record.reaction_time,
+                               system_latency=None if np.isnan(record.system_latency) else record.system_latency)
+
+    def __iter__(self):
+        return iter(self[:])
+
+class FrameStats():
+    """Frame times of an animation, kept in a preallocated array. Once it is full the
+    oldest frame times are overwritten. A frame taking more than 1.5 times budget_ms
+    missed at least one display refresh and counts as dropped.
+
+    :param capacity: number of frame times kept.
+    :param budget_ms: time a frame may take.
+    """
+    __slots__ = ('times', 'count', 'dropped', 'last_ns', 'budget_ns')
+
+    def __init__(self, capacity=FRAME_STATS_CAPACITY, budget_ms=FRAME_BUDGET_MS):
+        self.times = np.zeros(capacity, dtype=np.int64)
+        self.count = 0
+        self.dropped = 0
+        self.last_ns = None
+        self.budget_ns = int(budget_ms * 1.5e6)
+
+    def tick(self, now_ns):
+        """Call once per frame with perf_counter_ns()."""
+        if self.last_ns is not None:
+            frame_ns = now_ns - self.last_ns
+            self.times[self.count % len(self.times)] = frame_ns
+            self.count += 1
+            if frame_ns > self.budget_ns:
+                self.dropped += 1
+        self.last_ns = now_ns
+
+    def summary(self):
+        """Dict of the number of frames, dropped frames and the p50, p99 and max frame time in us.
+        Percentiles are over the kept frame times."""
+        times = self.times[:min(self.count, len(self.times))]
+        if not len(times):
+            return {'frames': 0, 'dropped_frames': 0, 'frame_p50_us': None, 'frame_p99_us': None,
+                    'frame_max_us': None}
+        p50, p99 = np.percentile(times, [50, 99]) / 1000
+        return {'frames': self.count, 'dropped_frames': self.dropped, 'frame_p50_us': int(p50),
+                'frame_p99_us': int(p99), 'frame_max_us': int(times.max() // 1000)}
 
 class EvaluationSession():
     """Stores evaluation context variables, parameters and results.
@@ -85,15 +481,35 @@ class EvaluationSession():
     :param fail_threshold: number of wrong answers needed to reset primary parameter to its initial_value.
     :param count: number of iterations of the sequence.
     :param duration_secs: duration of the sequence in seconds.
+    :param exercise: name of the exercise, stored with the results.
+    :param difficulty: name of the exercise configuration, stored with the results.
+    :param config_hash: hash of the exercise configuration, stored with the results.
 
     :func add_result(tuple): adds a tuple containing an evaluation result to the session results.
+    :func complete_result(): records the system latency of the last result once the evaluation is done.
     :func end(): stops the evaluation and displays the results.
+
+    With an active profile, every answer is streamed to the database as it is added, see profile.ResultWriter.
+
+    The countdown runs on the scheduler. Ending the session cancels every call the session owns.
+
+    Reaction time is the time between showing the stimulus and receiving the key. System latency
+    is the time between receiving the key and completing its evaluation, including drawing the
+    next stimulus. Both are measured with perf_counter_ns and stored in seconds.
+    :attr on_end: functions called without arguments when the session ends, before its window is deleted.
+    :attr results: ResultsBuffer.
+    :attr frame_stats: FrameStats of an animated exercise, stored with the session. None otherwise.
     """
+    __slots__ = ('window', 'win_uuid', 'handler_uuid', 'drawlist_uuid', 'primary_param_init', 'primary_param',
+                 'step', 'success_threshold', 'fail_threshold', 'count', 'duration_secs', 'exercise', 'difficulty',
+                 'config_hash', 'session_uuid', 'epoch_start', 'time_end', 'results', 'fail', 'success', 'active',
+                 'on_end', 'key_ns', 'streaming', 'streamed', 'frame_stats')
+
     def __init__(self, window_tag=None, **session_config):
         self.window = window_tag
-        self.win_uuid = dpg.generate_uuid()
-        self.handler_uuid = dpg.generate_uuid()
-        self.drawlist_uuid = dpg.generate_uuid()
+        self.win_uuid = drawing.active.generate_uuid()
+        self.handler_uuid = drawing.active.generate_uuid()
+        self.drawlist_uuid = drawing.active.generate_uuid()
         self.primary_param_init = session_config.get('primary_param_init', 0)
         self.primary_param = self.primary_param_init
         self.step = session_config.get('step', 1)
@@ -101,37 +517,60 @@ class EvaluationSession():
         self.fail_threshold = session_config.get('fail_threshold', 2)
         self.count = session_config.get('count', 50)
         self.duration_secs = session_config.get('duration_secs', 120)
+        self.exercise = session_config.get('exercise', '')
+        self.difficulty = session_config.get('difficulty', '')
+        self.config_hash = session_config.get('config_hash')
+        self.session_uuid = uuid4()
         self.epoch_start = time()
-        self.results = []
+        self.time_end = self.epoch_start + self.duration_secs
+        self.results = ResultsBuffer(min(self.count, 4096))
         self.fail = 0
         self.success = 0
         self.active = True
-        self.timer = Thread(target=self._countdown)
-        self.timer.start()
-        self.Result = namedtuple('Result', ['count', 'primary_param', 'correctness', 'time', 'time_diff'])
-
-    def dataframe(self) -> int:
-        raise NotImplemented()
-        df = pd.DataFrame(self.results, columns=['Count', 'Answer', 'Epoch', 'Diff_sec'])
-        return df
-
-    def add_result(self, result):
+        self.on_end = []
+        self.key_ns = None
+        self.streaming = profile.open_session(self)
+        self.streamed = 0   # number of results handed to the result writer
+        self.frame_stats = None
+        self._countdown()
+
+    def dataframe(self):
+        """Results as a pandas DataFrame. Needs pandas, imported here to keep it off the startup path."""
+        try:
+            import pandas as pd
+        except ImportError:
+            raise ImportError('EvaluationSession.dataframe() needs pandas') from None
+        return pd.DataFrame(self.results.array)
+
+    def add_result(self, result, shown_ns=None, key_ns=None):
+        """Add an evaluated answer.
+
+        :param result: correctness of the answer.
+        :param shown_ns: perf_counter_ns() at which the stimulus was shown, see DrawQueue.shown_ns.
+        :param key_ns: perf_counter_ns() at which the key press was received.
+        """
         now = time()
         count = len(self.results) + 1
         if count > 1:
-            prev = self.results[-1][3]
+            prev = self.results.column('time')[-1]
             diff = round(now - prev, 4)
         if count == 1:
             diff = 0
-        record = self.Result(count, self.primary_param, result, now, diff)
-        self.results.append(record)
+        reaction_time = None
+        if shown_ns and key_ns:
+            reaction_time = round((key_ns - shown_ns) / 1e9, 6)
+        self.key_ns = key_ns
+        # until complete_result() is called, latency covers the evaluation up to this point
+        system_latency = round((perf_counter_ns() - key_ns) / 1e9, 6) if key_ns else None
+        self.results.append(count, self.primary_param, result, now, diff, reaction_time, system_latency)
+        self._stream(len(self.results) - 1)    # the new answer is streamed once its latency is known
 
         if result == True:
             self.success += 1
             self.fail = 0
 
         if result == False:
-            self.succes = 0
+            self.success = 0
             self.fail += 1
 
         if self.success == self.success_threshold:
@@ -145,41 +584,140 @@ class EvaluationSession():
         if (len(self.results) >= self.count) & (self.active):
             self.end()
 
+    def complete_result(self):
+        """Call when the evaluation of the last answer is done, after the next stimulus is shown.
+        Stores the system latency with the last result."""
+        if not (self.results and self.key_ns):
+            return
+        latency_ns = perf_counter_ns() - self.key_ns
+        self.results.set(-1, 'system_latency', round(latency_ns / 1e9, 6))
+        self.key_ns = None
+        record_latency(latency_ns / 1e6)
+        self._stream(len(self.results))
+
+    def _stream(self, count):
+        """Hand the results up to count to the result writer, when streaming."""
+        if not self.streaming:
+            return
+        for record in self.results[self.streamed:count]:
+            profile.stream_result(self, record)
+        self.streamed = max(self.streamed, count)
+
     def _countdown(self):
-        """"Counts down time remaining in the evaluation session."""
-        time_end = time() + self.duration_secs
-        while (time() < time_end) & (self.active):
-            time_remaining = round(time_end - time())
-            dpg.set_value('str_time_remaining', time_remaining)
-            debugger(f'Countdown: {time_remaining}')
-            sleep(1)
-        dpg.set_value('str_time_remaining', 'All done.')
-        debugger(f'Countdown stopped.')
-        if self.active:
-            self.end()
+        """"Counts down time remaining in the evaluation session, once per second."""
+        time_remaining = round(self.time_end - time())
+        if time_remaining <= 0:
+            if self.active:
+                self.end()
+            return
+        drawing.active.set_value('str_time_remaining', time_remaining)
+        debugger('Countdown: %s', time_remaining)
+        scheduler.call_later(1, self._countdown, owner=self)
 
     def end(self):
-        """Ends the evaluation session. Destroys IO handler and window. Stops _countdown() thread. Creates results window."""
+        """Ends the evaluation session. Destroys IO handler and window. Cancels the countdown and
+        other scheduled calls of the session. Creates results window."""
         debugger('Stopping evaluation.')
         self.active = False
-        dpg.delete_item(self.handler_uuid)
-        dpg.delete_item(self.win_uuid)
-        eval_results(self.results)
+        scheduler.cancel(self)
+        drawing.active.set_value('str_time_remaining', 'All done.')
+        debugger('Countdown stopped.')
+        for func in self.on_end:
+            func()
+        if self.frame_stats:
+            debugger('Frame times: %s', self.frame_stats.summary(), level='info')
+        drawing.active.delete_item(self.handler_uuid)
+        drawing.active.delete_item(self.win_uuid)
+        if self.streaming:
+            self._stream(len(self.results))
+            profile.close_session(self)
+        if drawing.active.interactive:
+            eval_results(self.results)
+
+# rows of the results table that exist at a time, and the width of the Development plot in pixels
+RESULT_PAGE_ROWS = 50
+DEVELOPMENT_PLOT_WIDTH = 550
+
+def lttb(x, y, threshold):
+    """Indices of threshold points of the line x, y chosen by Largest-Triangle-Three-Buckets.
+    Keeps peaks and the shape of a line with more points than pixels to draw them.
+    Returns all indices when the line has no more than threshold points."""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # the first and last point are kept, the points between are split into threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    edges = np.append(edges, n)
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_x = x[end:edges[i + 2]].mean()
+        next_y = y[end:edges[i + 2]].mean()
+        # twice the area of the triangles of the previous pick, each point and the next bucket's mean
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(area.argmax())
+        indices[i + 1] = a
+    return indices
+
+def bucket_means(values, buckets):
+    """Splits values into buckets of (almost) equal size. Returns the center index and the mean per bucket."""
+    starts = np.linspace(0, len(values), buckets, endpoint=False).astype(np.int64)
+    sizes = np.diff(np.append(starts, len(values)))
+    return starts + (sizes - 1) / 2, np.add.reduceat(values.astype(np.float64), starts) / sizes
+
+def results_table(results, rows=RESULT_PAGE_ROWS):
+    """Table of results showing one page of rows at a time. Only the cells of one page
+    are created, they are filled from the results when the page changes.
+    :param results: ResultsBuffer.
+    :param rows: rows per page."""
+    fields = results.Result._fields
+    pages = max(1, -(-len(results) // rows))
+    row_tags = [dpg.generate_uuid() for _ in range(rows)]
+    cell_tags = [[dpg.generate_uuid() for _ in fields] for _ in range(rows)]
+
+    def show_page(page):
+        first = (page - 1) * rows
+        for row, i in enumerate(range(first, first + rows)):
+            if i < len(results):
+                for tag, value in zip(cell_tags[row], results[i]):
+                    dpg.set_value(tag, str(value))
+            dpg.configure_item(row_tags[row], show=i < len(results))
+
+    if pages > 1:
+        dpg.add_input_int(label=f'page of {pages}', width=120, default_value=1, min_value=1, max_value=pages,
+                          min_clamped=True, max_clamped=True, callback=lambda sender, page: show_page(page))
+    with dpg.table(resizable=False, policy=4, scrollY=False, header_row=True, clipper=True):
+        for field in fields:
+            dpg.add_table_column(width=25, width_stretch=True, label=field)
+        for row in range(rows):
+            with dpg.table_row(tag=row_tags[row]):
+                for tag in cell_tags[row]:
+                    dpg.add_text(tag=tag)
+    show_page(1)
 
 def eval_results(results):
-    count = []
-    param = []
-    correct = []
-    time_diff = []
-
-    for i, val in enumerate(results):
-        count.append(i)
-        param.append(val.primary_param)
-        correct.append(val.correctness)
-        time_diff.append(val.time_diff)
-
-    count_true = correct.count(True)
-    count_false = correct.count(False)
+    """Show a window with plots and a table of a ResultsBuffer. The Development plot
+    is downsampled to about one point per pixel."""
+    count = np.arange(len(results))
+    param = results.column('primary_param')
+    correct = results.column('correctness')
+    time_diff = results.column('time_diff')
+
+    count_true = int(correct.sum())
+    count_false = len(results) - count_true
+
+    param_x = time_x = count
+    correct_x, correct_y, bar_width = count, correct.astype(np.float64), 1.0
+    if len(results) > DEVELOPMENT_PLOT_WIDTH:
+        param_x = lttb(count, param, DEVELOPMENT_PLOT_WIDTH)
+        time_x = lttb(count, time_diff, DEVELOPMENT_PLOT_WIDTH)
+        # correctness is 0 or 1, drawn as the share of correct answers per bucket instead
+        correct_x, correct_y = bucket_means(correct, DEVELOPMENT_PLOT_WIDTH)
+        bar_width = len(results) / DEVELOPMENT_PLOT_WIDTH
 
     with dpg.window(width=800, height=600, modal=True):
         with dpg.table():
@@ -200,7 +738,7 @@ def eval_results(results):
                         # dpg.add_pie_series(0.5, 0.5, 0.5, [0.25, 0.30, 0.30], ["fish", "cow", "chicken"])
                         dpg.add_pie_series(0.5, 0.5, 0.5, values=[count_true, count_false], labels=['True', 'False'])
 
-                with dpg.plot(label="Development", height=250, width=550):
+                with dpg.plot(label="Development", height=250, width=DEVELOPMENT_PLOT_WIDTH):
                     y_score = dpg.generate_uuid()
                     y_difficulty = dpg.generate_uuid()
                     y_time_diff = dpg.generate_uuid()
@@ -211,18 +749,12 @@ def eval_results(results):
                     dpg.add_plot_axis(dpg.mvYAxis, label="Difficulty", tag=y_difficulty)
                     dpg.add_plot_axis(dpg.mvYAxis, label="Timing", tag=y_time_diff)
 
-                    dpg.add_bar_series(count, correct, label="Correct", parent=y_score)
-                    dpg.add_line_series(count, param, label="Param", parent=y_difficulty)
-                    dpg.add_line_series(count, time_diff, label="Time", parent=y_time_diff)
+                    dpg.add_bar_series(correct_x, correct_y, label="Correct", parent=y_score, weight=bar_width)
+                    dpg.add_line_series(param_x, param[param_x], label="Param", parent=y_difficulty)
+                    dpg.add_line_series(time_x, time_diff[time_x], label="Time", parent=y_time_diff)
 
         with dpg.collapsing_header(label='Results'):
-            with dpg.table(resizable=False, policy=4, scrollY=False, header_row=True):
-                for field in results[0]._fields:
-                    dpg.add_table_column(width=25, width_stretch=True, label=field)
-                for i in range(len(results)):
-                    with dpg.table_row():
-                        for field in results[0]._fields:
-                            dpg.add_text(getattr(results[i], field))   # primary param
+            results_table(results)
 
 
 @contextmanager
@@ -235,12 +767,46 @@ def parent(parent_id):
     finally:
         dpg.pop_container_stack()
 
-def debugger(debug_data, level='info'):
-    """Sends data to the debugging window and the debug logger."""
-    logging.debug(debug_data)
-    if dpg.get_value('bool_debug') == True:
-        old_data = dpg.get_value('txt_debug')
-        dpg.set_value('txt_debug', f'{debug_data}\n{old_data}')
+class DebugLog():
+    """The last lines sent to debugger, newest first, for the debug window.
+
+    Lines are kept as a message and its arguments in a ring buffer and only formatted when
+    the window is refreshed. refresh() is called once per frame while the debug text is visible.
+    :param capacity: number of lines kept.
+    """
+    def __init__(self, capacity=DEBUG_LOG_LINES):
+        self.lines = deque(maxlen=capacity)
+        self.changed = False
+
+    def add(self, message, args):
+        self.lines.append((message, args))
+        self.changed = True
+
+    def text(self):
+        return '\n'.join(message % args if args else str(message) for message, args in reversed(list(self.lines)))
+
+    def refresh(self, *_):
+        """Sets 'txt_debug' if lines were added since the last refresh."""
+        if self.changed:
+            self.changed = False
+            drawing.active.set_value('txt_debug', self.text())
+
+debug_log = DebugLog()
+
+def debugger(message, *args, level='debug'):
+    """Sends a message to the logger and, if 'bool_debug' is set, to the debug window.
+    As with logging, message is %-formatted with args only when it is shown or logged, so
+    pass the arguments on hot paths instead of an f-string.
+    :param level: name of the logging level."""
+    if drawing.active.get_value('bool_debug') == True:
+        debug_log.add(message, args)
+    logging.log(logging.getLevelName(level.upper()), message, *args)
+
+def record_latency(latency_ms):
+    """Adds a system latency to the histogram in the debug window."""
+    system_latencies.append(latency_ms)
+    if drawing.active.does_item_exist('hist_system_latency'):
+        drawing.active.set_value('hist_system_latency', [list(system_latencies)])
 
 def delete(sender, app_data):
     dpg.delete_item(sender)
@@ -260,7 +826,7 @@ def center(item, rel_y=None):
 
         newpos_x = viewport_width / 2 - item_width / 2
         newpos_y = rel_y_positions[rel_y]
-        debugger(f'setting pos [{newpos_x, newpos_y}] for {item}')
+        debugger('setting pos [%s, %s] for %s', newpos_x, newpos_y, item)
         dpg.set_item_pos(item, [newpos_x, newpos_y])
 
 def resizer():
@@ -0,0 +1,170 @@
+"""Module containing the frame loop and job runner of Vizier.
+
+The application runs dpg with manual_callback_management: dpg queues callbacks instead
+of running them on a thread of its own, and run_frame() runs them on the render thread,
+once per frame. Everything that changes the UI happens on that thread:
+
+- Other threads hand UI changes to post(), they run at the start of the next frame.
+- Expensive work is a job: a generator that yields between chunks of work. Jobs run
+  one chunk after another, after the callbacks and posted calls, until the frame
+  budget is spent, and continue in the next frame. Split work into chunks of well
+  under the budget.
+
+Without a running frame loop, for instance in the benchmarks, jobs are run to
+completion with complete() instead.
+"""
+
+import inspect
+import logging
+from collections import deque
+from time import perf_counter_ns
+import dearpygui.dearpygui as dpg
+from . import tracing
+
+# time the jobs of a frame may take, see run_frame()
+FRAME_BUDGET_MS = 4
+
+def complete(job):
+    """Runs a job to completion right away. Returns its result."""
+    while True:
+        try:
+            next(job)
+        except StopIteration as done:
+            return done.value
+
+def parameter_count(func):
+    try:
+        return len(inspect.signature(func).parameters)
+    except (TypeError, ValueError):    # functions without a signature, like some builtins
+        return 3
+
+class Job():
+    """Handle to a job submitted to a JobRunner.
+
+    :attr done: True once the job has finished or was cancelled.
+    :attr result: what the job returned.
+    """
+    def __init__(self, job, on_done, owner):
+        self.job = job
+        self.on_done = on_done
+        self.owner = owner
+        self.done = False
+        self.result = None
+
+    def step(self):
+        """Runs one chunk. Returns True when the job has finished."""
+        try:
+            next(self.job)
+            return False
+        except StopIteration as done:
+            self.done = True
+            self.result = done.value
+            if self.on_done:
+                self.on_done(self.result)
+            return True
+
+    def cancel(self):
+        """Stops the job between two chunks. on_done is not called."""
+        if not self.done:
+            self.done = True
+            self.job.close()
+
+class JobRunner():
+    """Runs dpg callbacks, posted calls and jobs on the render thread, see run_frame().
+
+    :attr running: True while the application frame loop runs.
+    :attr over_budget: number of frames whose jobs ran past the budget.
+    """
+    def __init__(self):
+        self.posted = deque()   # (func, args) from any thread, appending and popping is thread safe
+        self.jobs = deque()
+        self.running = False
+        self.frames = 0
+        self.over_budget = 0
+
+    def post(self, func, *args):
+        """Call func(*args) on the render thread at the start of the next frame. Safe from any thread."""
+        self.posted.append((func, args))
+
+    def submit(self, job, on_done=None, owner=None):
+        """Queue a job, a generator yielding between chunks of work. Jobs run in the order they
+        were submitted. Must be called on the render thread. Returns a Job.
+
+        :param on_done: called with the return value of the job when it finishes.
+        :param owner: cancel(owner) cancels all unfinished jobs of that owner.
+        """
+        handle = Job(job, on_done, owner)
+        self.jobs.append(handle)
+        return handle
+
+    def finish(self, handle):
+        """Runs the remaining chunks of a job right away, for when its result is needed now."""
+        while not handle.done:
+            handle.step()
+
+    def cancel(self, owner):
+        for handle in self.jobs:
+            if handle.owner == owner:
+                handle.cancel()
+
+    def run_callbacks(self):
+        """Runs the callbacks dpg queued since the last frame. Like dpg.run_callbacks(), a callback
+        gets as many of sender, app_data and user_data as it has parameters."""
+        for callback, *args in dpg.get_callback_queue() or ():
+            if callback is None:
+                continue
+            try:
+                callback(*args[:parameter_count(callback)])
+            except Exception:
+                logging.exception(f'Callback {getattr(callback, "__qualname__", callback)} failed')
+
+    def run_posted(self):
+        """Runs the calls posted before this frame started."""
+        for _ in range(len(self.posted)):
+            func, args = self.posted.popleft()
+            try:
+                func(*args)
+            except Exception:
+                logging.exception(f'Posted call to {getattr(func, "__qualname__", func)} failed')
+
+    def run_jobs(self, budget_ms=FRAME_BUDGET_MS, start_ns=None):
+        """Runs chunks of jobs until budget_ms after start_ns. At least one chunk runs per frame,
+        so jobs progress even when callbacks took the whole budget."""
+        deadline_ns = (start_ns or perf_counter_ns()) + budget_ms * 1e6
+        ran = False
+        while self.jobs:
+            if ran and perf_counter_ns() >= deadline_ns:
+                break
+            handle = self.jobs[0]
+            if not handle.done:
+                try:
+                    handle.step()
+                except Exception:
+                    handle.done = True
+                    logging.exception('Job failed')
+                ran = True
+            if handle.done:
+                self.jobs.popleft()
+        if ran and perf_counter_ns() > deadline_ns:
+            self.over_budget += 1
+
+    @tracing.traced()
+    def run_frame(self, budget_ms=FRAME_BUDGET_MS):
+        """The work of one frame: dpg callbacks, posted calls, then jobs within budget_ms."""
+        start_ns = perf_counter_ns()
+        self.frames += 1
+        self.run_callbacks()
+        self.run_posted()
+        self.run_jobs(budget_ms, start_ns)
+
+    def loop(self, budget_ms=FRAME_BUDGET_MS):
+        """The frame loop of the application. Returns when the viewport is closed."""
+        self.running = True
+        try:
+            while dpg.is_dearpygui_running():
+                self.run_frame(budget_ms)
+                dpg.render_dearpygui_frame()
+        finally:
+            self.running = False
+
+runner = JobRunner()
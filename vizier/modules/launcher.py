@@ -1,9 +1,10 @@
 """Module containing evaluation programs for various exercises."""
 import dearpygui.dearpygui as dpg
-import yaml
 from . import helpers
 from . import profile
-from ..exercises  import * # NOTE yes frowned upon but programmatic ways dont work?
+from . import configuration
+from . import atlas
+from .. import exercises as plugins
 
 def generic(sender, app_data, user_data=''):
     if sender == 'btn_close':
@@ -16,26 +17,31 @@ def generic(sender, app_data, user_data=''):
 def evaluations():
     def launch(sender, app_data, user_data):
         # extract data from tuple 'user_data'
-        evaluation_func = f'{user_data[0]}.run'  # the module to call. Expects 'run()'.
-        config = user_data[1]                    # the configuration dict
-        eval(evaluation_func)(config)
+        plugin = user_data[0]   # the plugin to run. Expects 'run()'.
+        config = user_data[1]   # the Configuration namedtuple
+        atlas.load()    # packs or reads the stimulus images on the first launch
+        plugins.load(plugin).run(config)
+
+    try:
+        exercises = configuration.exercises()
+    except configuration.ConfigError as e:
+        helpers.error(str(e), 'Exercises could not be loaded.')
+        return
 
     with dpg.window(pos=[100, 100], width=500, height=500):
-        with open('vizier/config/exercise_configs.yaml') as config_file:
-            configs = yaml.safe_load(config_file)
 
         with dpg.table(header_row=False):
             dpg.add_table_column(width_stretch=True)
             dpg.add_table_column(width_stretch=True)
             dpg.add_table_column(width_stretch=True)
             dpg.add_table_column(width_stretch=True)
-            for key_, value_ in configs['Exercises'].items(): # get different exercices
+            for exercise in exercises:
                 with dpg.table_row():
-                    dpg.add_text(key_)  # exercise name
-                    dpg.add_text(value_.get('Plugin')) # exercise type
+                    dpg.add_text(exercise.name)
+                    dpg.add_text(exercise.plugin)  # exercise type
                 with dpg.table_row():
-                    for config, params in configs['Exercises'][key_]['Configurations'].items():    # get configs per exercise
-                        dpg.add_button(label=config, callback=launch, user_data=(value_.get('Plugin'), params))
+                    for config in exercise.configurations:
+                        dpg.add_button(label=config.difficulty, callback=launch, user_data=(exercise.plugin, config))
 
 if __name__ == '__main__':
     print('Only to be used as part of the Vizier application.')
@@ -1,20 +1,24 @@
 import peewee as pw
 import dearpygui.dearpygui as dpg
-import yaml
-from pathlib import Path
+import logging
+import numpy as np
+from queue import Queue, Empty, Full
+from collections import deque
+from datetime import datetime
+from threading import Thread, Lock
+from time import time, perf_counter
 from . import helpers
+from . import tracing
 from .theme import COLORS
+from .profile_datamodel import db
 from .profile_datamodel import ActiveProfile
 from .profile_datamodel import User
 from .profile_datamodel import CalibrationData
 from .profile_datamodel import BaseModel
-from .profile_datamodel import Result
-
-with open("./vizier/config/config.yaml") as config_file:
-    config = yaml.safe_load(config_file)
-
-db_path = config["application"]["profile_db_path"]
-db = pw.SqliteDatabase(db_path)
+from .profile_datamodel import Session
+from .profile_datamodel import Answer
+from .profile_datamodel import SessionSummary, DailySummary, update_summaries
+from .profile_datamodel import ensure_schema
 
 SESSION = ActiveProfile()
 
@@ -49,24 +53,337 @@ def add_user():
         dpg.add_input_text(tag='last_name', label='Last name')
         dpg.add_button(label='Add', callback=db_user_add, user_data=winid)
 
+class ResultWriter():
+    """Writes results to the database on a background thread.
+
+    Callers never wait: put() hands work to a bounded queue. When the writer falls behind and
+    the queue is full, work waits in order in an overflow list. The writer drains the queue in
+    batches bounded by batch_rows and batch_secs, so answers streamed during a session are
+    on disk within about a second. Each batch is one transaction, rows are written with
+    insert_many.
+    :param database: database the Session and Answer models are bound to.
+    :param chunk_size: rows per INSERT statement, keeps below the sqlite variable limit.
+    :param batch_rows: write once this many rows are waiting.
+    :param batch_secs: write at most this long after the first row of a batch arrived.
+    :param max_pending: size of the queue.
+    """
+    def __init__(self, database=db, chunk_size=50, batch_rows=50, batch_secs=1.0, max_pending=1000):
+        self.database = database
+        self.chunk_size = chunk_size
+        self.batch_rows = batch_rows
+        self.batch_secs = batch_secs
+        self.pending = Queue(maxsize=max_pending)
+        self.overflow = deque()     # work that did not fit in pending, in order
+        self.overflow_lock = Lock()
+        self.overflowed = 0
+        self.thread = None
+        self.rows_written = 0
+        self.write_secs = 0
+        self.sessions = {}  # session uuid: (Session id, started) of sessions written to
+
+    def put(self, kind, payload):
+        """Queue work for the writer. kind is 'rows' (a list of result_rows() dicts), 'open' (a
+        Session row dict) or 'close' (a dict of the session uuid, the time it ended and optionally
+        frame statistics). Returns immediately."""
+        if self.thread is None:
+            self.thread = Thread(target=self._run, name='result_writer', daemon=True)
+            self.thread.start()
+        with self.overflow_lock:
+            if not self.overflow:
+                try:
+                    self.pending.put_nowait((kind, payload))
+                    return
+                except Full:
+                    pass
+            # the writer is behind, keep the order: work after overflow is overflow too
+            self.overflow.append((kind, payload))
+            self.overflowed += 1
+
+    def _refill(self):
+        """Moves overflow into the queue as far as it fits. The writer calls it whenever it took
+        work from the queue."""
+        with self.overflow_lock:
+            while self.overflow:
+                try:
+                    self.pending.put_nowait(self.overflow[0])
+                except Full:
+                    return
+                self.overflow.popleft()
+
+    def add(self, rows):
+        """Queue a list of row dicts for writing."""
+        self.put('rows', rows)
+
+    def _run(self):
+        while True:
+            items = [self.pending.get()]
+            self._refill()
+            rows = len(items[0][1]) if items[0][0] == 'rows' else 0
+            deadline = perf_counter() + self.batch_secs
+            while rows < self.batch_rows and items[-1][0] != 'close':
+                timeout = deadline - perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(self.pending.get(timeout=timeout))
+                except Empty:
+                    break
+                self._refill()
+                if items[-1][0] == 'rows':
+                    rows += len(items[-1][1])
+            try:
+                self.write(items)
+            except Exception:
+                logging.exception(f'Writing {len(items)} result batches failed')
+            finally:
+                # refilled before task_done(), so flush() does not return while overflow is waiting
+                for _ in items:
+                    self.pending.task_done()
+
+    @tracing.traced()
+    def write(self, items):
+        start = perf_counter()
+        rows = []
+        if self.database is db:
+            ensure_schema()
+        with self.database.connection_context():
+            with self.database.atomic():
+                for kind, payload in items + [(None, None)]:
+                    if kind == 'rows':
+                        rows.extend(payload)
+                        continue
+                    answers = [answer_row(row, *self.session(row)) for row in rows]
+                    for chunk in pw.chunked(answers, self.chunk_size):
+                        Answer.insert_many(chunk).execute()
+                    update_summaries(rows)
+                    self.rows_written += len(rows)
+                    rows = []
+                    if kind == 'open':
+                        Session.insert(**payload).on_conflict_ignore().execute()
+                    elif kind == 'close':
+                        values = {key: value for key, value in payload.items() if key != 'uuid'}
+                        Session.update(**values).where(Session.uuid == payload['uuid']).execute()
+                        self.sessions.pop(payload['uuid'], None)
+        self.write_secs += perf_counter() - start
+
+    def session(self, row):
+        """Returns the Session id and start time for a result row. Creates the Session for
+        results that were not streamed, starting at the time of the first answer."""
+        if row['session'] not in self.sessions:
+            session = Session.get_or_none(Session.uuid == row['session'])
+            if session is None:
+                session = Session.create(uuid=row['session'], user=row['user'], exercise=row['exercise'],
+                                         difficulty=row['difficulty'], started=row['time'] - row['time_diff'])
+            self.sessions[row['session']] = (session.id, session.started)
+        return self.sessions[row['session']]
+
+    def flush(self):
+        """Wait until all queued results are written, overflow included."""
+        self.pending.join()
+
+    def rows_per_sec(self):
+        return self.rows_written / self.write_secs if self.write_secs else 0
+
+writer = ResultWriter()
+
+def result_rows(username, session, exercise, difficulty, results):
+    """Convert session results to row dicts for the result writer."""
+    return [{
+        'user': username,
+        'session': session,
+        'exercise': exercise,
+        'difficulty': difficulty,
+        'created': datetime.fromtimestamp(result.time),
+        'count': result.count,
+        'primary_param': result.primary_param,
+        'correctness': result.correctness,
+        'time': result.time,
+        'time_diff': result.time_diff,
+        'reaction_time': result.reaction_time,
+        'system_latency': result.system_latency,
+    } for result in results]
+
+def answer_row(row, session_id, started):
+    """Convert a result row dict to an Answer row dict, times in seconds become integers."""
+    def microseconds(secs):
+        return None if secs is None else round(secs * 1e6)
+
+    return {
+        'session': session_id,
+        'count': row['count'],
+        'primary_param': row['primary_param'],
+        'correctness': row['correctness'],
+        'time_ms': round((row['time'] - started) * 1000),
+        'time_diff_ms': round(row['time_diff'] * 1000),
+        'reaction_time_us': microseconds(row['reaction_time']),
+        'system_latency_us': microseconds(row['system_latency']),
+    }
+
 def add_result_from_tuples(username, session, exercise, difficulty, results):
-    with db:
-        for result in results:
-            Result.create(
-                user=username,
-                session=session,
-                exercise=exercise,
-                difficulty=difficulty,
-                count=result.count,
-                primary_param=result.primary_param,
-                correctness=result.correctness,
-                time = result.time,
-                time_diff=result.time_diff,
-            )
-
-def get_results():
-    raise NotImplementedError()
+    """Queue the results of a complete session for the background writer."""
+    writer.add(result_rows(username, session, exercise, difficulty, results))
+    writer.put('close', {'uuid': session, 'ended': results[-1].time})
+
+def open_session(session):
+    """Start streaming the answers of an EvaluationSession for the active user.
+    Returns False when no user is active, nothing is stored then."""
+    if not SESSION.user:
+        return False
+    writer.put('open', {'uuid': session.session_uuid, 'user': SESSION.user.id, 'exercise': session.exercise,
+                        'difficulty': session.difficulty, 'started': session.epoch_start,
+                        'config_hash': session.config_hash})
+    return True
+
+def stream_result(session, result):
+    """Queue a single answer of a streaming session."""
+    writer.add(result_rows(SESSION.user.id, session.session_uuid, session.exercise, session.difficulty, [result]))
+
+def close_session(session):
+    """Mark a streaming session as complete once its answers are written. Stores the frame
+    time statistics of animated sessions."""
+    payload = {'uuid': session.session_uuid, 'ended': time()}
+    if session.frame_stats:
+        payload.update(session.frame_stats.summary())
+    writer.put('close', payload)
+
+@tracing.traced()
+def recover_orphaned_sessions():
+    """Sessions still open at startup were cut short by a crash. Their streamed answers are
+    kept as a partial session, ending at the last answer. Returns a list of (session uuid, number of answers)."""
+    recovered = []
+    ensure_schema()
+    with db.connection_context():
+        for orphan in Session.select().where(Session.ended.is_null()):
+            answers, last_ms = Answer.select(pw.fn.COUNT(Answer.count), pw.fn.MAX(Answer.time_ms)) \
+                                     .where(Answer.session == orphan.id).scalar(as_tuple=True)
+            recovered.append((orphan.uuid, answers))
+            helpers.debugger('Recovered %s answers of interrupted session %s (%s/%s)', answers, orphan.uuid,
+                             orphan.exercise, orphan.difficulty, level='info')
+            orphan.ended = orphan.started + (last_ms or 0) / 1000
+            orphan.save()
+    return recovered
+
+def local_datetimes(epoch_secs):
+    """Convert an array of epoch seconds to local datetime64 values, like datetime.fromtimestamp().
+    Converts each distinct value once: these are session start times, shared by many answers."""
+    distinct, index = np.unique(epoch_secs, return_inverse=True)
+    return np.array([datetime.fromtimestamp(secs) for secs in distinct], dtype='datetime64[us]')[index]
+
+# numpy dtype per column returned by get_results(). Missing floats become nan.
+RESULT_COLUMNS = {
+    'session': object,
+    'exercise': object,
+    'difficulty': object,
+    'created': 'datetime64[us]',
+    'count': np.int64,
+    'primary_param': np.float64,
+    'correctness': np.bool_,
+    'time': np.float64,
+    'time_diff': np.float64,
+    'reaction_time': np.float64,
+    'system_latency': np.float64,
+}
+
+@tracing.traced()
+def get_results(user=None, exercise=None, difficulty=None, start=None, end=None, after=None,
+                limit=10000, columns=None):
+    """Fetch answers in the order they were given, one page at a time.
+
+    Rows are returned as columns, a dict of numpy arrays, not as model instances.
+    :param user: User or user id. All users when None, likewise for the other filters.
+    :param exercise: exercise name.
+    :param difficulty: exercise configuration name.
+    :param start: datetime, only sessions started at or after start.
+    :param end: datetime, only sessions started before end.
+    :param after: cursor returned with the previous page.
+    :param limit: maximum number of rows in the page.
+    :param columns: names of the columns to return, see RESULT_COLUMNS. Defaults to all.
+    :returns: (dict of column name: array, cursor for the next page or None if this was the last page)
+    """
+    query = Answer.select(Session.uuid, Session.exercise, Session.difficulty, Session.started, Answer.count,
+                          Answer.primary_param, Answer.correctness, Answer.time_ms, Answer.time_diff_ms,
+                          Answer.reaction_time_us, Answer.system_latency_us, Answer.session).join(Session)
+    if user is not None:
+        query = query.where(Session.user == user)
+    if exercise is not None:
+        query = query.where(Session.exercise == exercise)
+    if difficulty is not None:
+        query = query.where(Session.difficulty == difficulty)
+    if start is not None:
+        query = query.where(Session.started >= start.timestamp())
+    if end is not None:
+        query = query.where(Session.started < end.timestamp())
+    if after is not None:
+        # a row value comparison lets sqlite seek in the index instead of scanning earlier pages
+        query = query.where(pw.Tuple(Session.started, Session.id, Answer.count) > pw.Tuple(*after))
+    # Session.id rather than Answer.session: the index on Session then yields rows in order, without a sort
+    query = query.order_by(Session.started, Session.id, Answer.count).limit(limit)
+
+    # raw rows from the cursor skip peewee's per-value conversions. The connection is kept open,
+    # reconnecting for every page costs more than the query.
+    database = Answer._meta.database
+    if database is db:
+        ensure_schema()
+    database.connect(reuse_if_open=True)
+    rows = database.execute(query).fetchall()
+    cursor = (rows[-1][3], rows[-1][11], rows[-1][4]) if len(rows) == limit else None
+
+    values = list(zip(*rows)) or [()] * 12
+    started = np.array(values[3], dtype=np.float64)
+    time_ms = np.array(values[7], dtype=np.int64)
+    results = {
+        'session': np.array(values[0], dtype=object).astype(str),
+        'exercise': np.array(values[1], dtype=object),
+        'difficulty': np.array(values[2], dtype=object),
+        'created': local_datetimes(started) + time_ms.astype('timedelta64[ms]'),
+        'count': np.array(values[4], dtype=np.int64),
+        'primary_param': np.array(values[5], dtype=np.float64),
+        'correctness': np.array(values[6], dtype=np.bool_),
+        'time': started + time_ms / 1000,
+        'time_diff': np.array(values[8], dtype=np.float64) / 1000,
+        'reaction_time': np.array(values[9], dtype=np.float64) / 1e6,
+        'system_latency': np.array(values[10], dtype=np.float64) / 1e6,
+    }
+    return {name: results[name] for name in (columns or RESULT_COLUMNS)}, cursor
+
+@tracing.traced()
+def get_summaries(user=None, exercise=None, difficulty=None, per='day'):
+    """Fetch pre-aggregated results for history charts, as a dict of numpy arrays in time order.
+
+    :param per: 'day' for DailySummary rows, 'session' for SessionSummary rows.
+    :returns: totals per row plus 'accuracy' and 'mean_reaction_time' columns, nan where undefined.
+    """
+    model, time_field = (DailySummary, DailySummary.day) if per == 'day' else (SessionSummary, SessionSummary.started)
+    query = model.select(time_field, model.exercise, model.difficulty, model.answers, model.correct,
+                         model.reaction_time_sum, model.reaction_time_count, model.max_primary_param)
+    if user is not None:
+        query = query.where(model.user == user)
+    if exercise is not None:
+        query = query.where(model.exercise == exercise)
+    if difficulty is not None:
+        query = query.where(model.difficulty == difficulty)
+    query = query.order_by(time_field)
+
+    database = model._meta.database
+    if database is db:
+        ensure_schema()
+    database.connect(reuse_if_open=True)
+    rows = database.execute(query).fetchall()
+    names = [time_field.name, 'exercise', 'difficulty', 'answers', 'correct',
+             'reaction_time_sum', 'reaction_time_count', 'max_primary_param']
+    dtypes = ['datetime64[D]' if per == 'day' else np.float64, object, object, np.int64, np.int64,
+              np.float64, np.int64, np.float64]
+    values = list(zip(*rows)) or [()] * len(names)
+    summaries = {name: np.array(values[i], dtype=dtype) for i, (name, dtype) in enumerate(zip(names, dtypes))}
+    if per != 'day':
+        summaries['started'] = local_datetimes(summaries['started'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        summaries['accuracy'] = summaries['correct'] / summaries['answers']
+        summaries['mean_reaction_time'] = summaries['reaction_time_sum'] / summaries['reaction_time_count']
+    summaries['mean_reaction_time'][summaries['reaction_time_count'] == 0] = np.nan
+    return summaries
 
+@tracing.traced()
 def list_users(parentid):
     with dpg.table(header_row=False, resizable=False, policy=4, scrollY=False, parent=parentid):
         dpg.add_table_column(init_width_or_weight=50, width_stretch=True)
@@ -84,6 +401,7 @@ def list_users(parentid):
                     dpg.add_table_cell()
                     dpg.add_button(label='Add user', callback=add_user, width=250)
 
+@tracing.traced_callback()
 def activate_user(sender, app_data, userdata):
     def _to_tuple(x):
         """Unfortunately sqlite saves our tuples as a string.
@@ -109,6 +427,7 @@ def activate_user(sender, app_data, userdata):
         dpg.delete_item('win_switch_user')
 
 def switch_user():
+    ensure_schema()
     with db:
         with dpg.window(tag='win_switch_user', pos=[200, 100], width=400, height=400, no_close=True, no_move=True, no_resize=True, no_collapse=True, label='Select user', on_close=helpers.delete):
             helpers.center('win_switch_user')
@@ -1,14 +1,16 @@
 import peewee as pw
-import yaml
+from playhouse.migrate import SqliteMigrator, migrate
 from datetime import datetime
 from pathlib import Path
 from dataclasses import dataclass
+from threading import Lock
+from . import configuration
 
-with open("./vizier/config/config.yaml") as config_file:
-    config = yaml.safe_load(config_file)
-
-db_path = config["application"]["profile_db_path"]
-db = pw.SqliteDatabase(db_path)
+db_path = configuration.application().profile_db_path
+# WAL lets the result writer commit while the UI thread reads. With WAL, synchronous=normal
+# is still safe against corruption and only risks the last commits on power loss.
+PRAGMAS = {'journal_mode': 'wal', 'synchronous': 'normal'}
+db = pw.SqliteDatabase(db_path, pragmas=PRAGMAS)
 
 # dataclass for anaglyph glasses color calibration data
 @dataclass
@@ -27,7 +29,6 @@ class ActiveProfile():
     def __init__(self):
         self.user = False
         self.calibration_data = CalibrationData()
-        self.db_safe_init()
 
     def activate(self, username):
         """Fetch data from the database and store it in the session."""
@@ -36,6 +37,7 @@ class ActiveProfile():
             We have to convert this string back to a tuple."""
             return tuple(map(float, x[1:-1].split(',')))
 
+        ensure_schema()
         with db:
             self.user = User.get(User.username == username)
             self.calibration_data = CalibrationData.get(CalibrationData.user == self.user.id)
@@ -43,13 +45,6 @@ class ActiveProfile():
                 # self.calibration.color_left = _to_tuple(calibdata.color_left)
                 # self.calibration.color_right = _to_tuple(calibdata.color_right)
 
-    def db_safe_init(self):
-        """Explicitly open the database, create tables and close. Initalizes missing tables."""
-        tables = [User(), CalibrationData(), Result()]
-        db.connect()
-        db.create_tables(tables)
-        db.close()
-
     def __repr__(self):
         if self.user:
             return f'[{self.user.id}] {self.user.first_name} {self.user.last_name} ({self.user.username})'
@@ -72,14 +67,213 @@ class CalibrationData(BaseModel):
     color_left = pw.CharField()
     color_right = pw.CharField()
 
-class Result(BaseModel):
-    user = pw.ForeignKeyField(User, backref="results")
-    session = pw.UUIDField()
+class Session(BaseModel):
+    """One run of an exercise configuration. Sessions without 'ended' are running, or were cut short."""
+    uuid = pw.UUIDField(unique=True)
+    user = pw.ForeignKeyField(User, backref="sessions", index=False)
     exercise = pw.CharField()
-    difficulty = pw.CharField()
-    created = pw.DateTimeField(default=datetime.now)
+    difficulty = pw.CharField()     # name of the exercise configuration
+    started = pw.FloatField()       # epoch seconds
+    ended = pw.FloatField(null=True)
+    config_hash = pw.CharField(null=True)
+    # frame times of animated exercises, see helpers.FrameStats
+    frames = pw.IntegerField(null=True)
+    dropped_frames = pw.IntegerField(null=True)
+    frame_p50_us = pw.IntegerField(null=True)
+    frame_p99_us = pw.IntegerField(null=True)
+    frame_max_us = pw.IntegerField(null=True)
+
+    class Meta:
+        # history of a user per exercise, in order. create_tables() adds missing indexes to existing databases.
+        indexes = (
+            (('user', 'exercise', 'started'), False),
+        )
+
+class Answer(BaseModel):
+    """A single answer. Times are stored as integers, profile.get_results() returns them in seconds."""
+    session = pw.ForeignKeyField(Session, backref="answers", index=False)
     count = pw.IntegerField()
     primary_param = pw.IntegerField(null=True)
     correctness = pw.BooleanField()
-    time = pw.FloatField()
-    time_diff = pw.FloatField()
+    time_ms = pw.IntegerField()                         # answered, after Session.started
+    time_diff_ms = pw.IntegerField()                    # since the previous answer
+    reaction_time_us = pw.IntegerField(null=True)       # stimulus shown to key received
+    system_latency_us = pw.IntegerField(null=True)      # key received to evaluation done
+
+    class Meta:
+        # answers are stored clustered per session, without a separate rowid
+        primary_key = pw.CompositeKey('session', 'count')
+        without_rowid = True
+
+class Summary(BaseModel):
+    """Totals of a group of answers. Subclasses are kept up to date by update_summaries()."""
+    answers = pw.IntegerField()
+    correct = pw.IntegerField()
+    reaction_time_sum = pw.FloatField()
+    reaction_time_count = pw.IntegerField()
+    max_primary_param = pw.IntegerField(null=True)
+
+    @property
+    def accuracy(self):
+        return self.correct / self.answers if self.answers else None
+
+    @property
+    def mean_reaction_time(self):
+        return self.reaction_time_sum / self.reaction_time_count if self.reaction_time_count else None
+
+class SessionSummary(Summary):
+    session = pw.UUIDField(unique=True)
+    user = pw.ForeignKeyField(User, backref="session_summaries")
+    exercise = pw.CharField()
+    difficulty = pw.CharField()
+    started = pw.FloatField()   # epoch seconds
+
+    class Meta:
+        indexes = (
+            (('user', 'exercise', 'started'), False),
+        )
+
+class DailySummary(Summary):
+    user = pw.ForeignKeyField(User, backref="daily_summaries")
+    exercise = pw.CharField()
+    difficulty = pw.CharField()
+    day = pw.DateField()
+
+    class Meta:
+        indexes = (
+            (('user', 'exercise', 'difficulty', 'day'), True),
+        )
+
+SUMMARY_TOTALS = ['answers', 'correct', 'reaction_time_sum', 'reaction_time_count']
+
+def _totals(rows):
+    """Summary totals of a list of result row dicts."""
+    reaction_times = [row['reaction_time'] for row in rows if row['reaction_time'] is not None]
+    params = [row['primary_param'] for row in rows if row['primary_param'] is not None]
+    return {
+        'answers': len(rows),
+        'correct': sum(bool(row['correctness']) for row in rows),
+        'reaction_time_sum': sum(reaction_times),
+        'reaction_time_count': len(reaction_times),
+        'max_primary_param': max(params, default=None),
+    }
+
+def _upsert(model, rows, conflict_target):
+    """Insert summary rows, or add them to the totals of existing rows."""
+    update = {getattr(model, name): getattr(model, name) + getattr(pw.EXCLUDED, name) for name in SUMMARY_TOTALS}
+    # sqlite's scalar max() returns NULL when either argument is NULL
+    update[model.max_primary_param] = pw.fn.MAX(
+        pw.fn.COALESCE(model.max_primary_param, pw.EXCLUDED.max_primary_param),
+        pw.fn.COALESCE(pw.EXCLUDED.max_primary_param, model.max_primary_param))
+    for row in rows:
+        model.insert(**row).on_conflict(conflict_target=conflict_target, update=update).execute()
+
+def update_summaries(rows):
+    """Add newly written result row dicts to the session and daily summaries.
+    Call within the transaction that writes the rows. See profile.result_rows() for the row dicts."""
+    sessions = {}
+    days = {}
+    for row in rows:
+        sessions.setdefault(row['session'], []).append(row)
+        day = (row['user'], row['exercise'], row['difficulty'], row['created'].date())
+        days.setdefault(day, []).append(row)
+
+    _upsert(SessionSummary, [
+        dict(_totals(session_rows), session=session, user=session_rows[0]['user'], exercise=session_rows[0]['exercise'],
+             difficulty=session_rows[0]['difficulty'], started=min(row['time'] for row in session_rows))
+        for session, session_rows in sessions.items()
+    ], [SessionSummary.session])
+    _upsert(DailySummary, [
+        dict(_totals(day_rows), user=user, exercise=exercise, difficulty=difficulty, day=day)
+        for (user, exercise, difficulty, day), day_rows in days.items()
+    ], [DailySummary.user, DailySummary.exercise, DailySummary.difficulty, DailySummary.day])
+
+def backfill_summaries():
+    """Rebuild the session and daily summaries from all stored answers."""
+    totals = [pw.fn.COUNT(Answer.count), pw.fn.SUM(Answer.correctness), pw.fn.TOTAL(Answer.reaction_time_us) / 1e6,
+              pw.fn.COUNT(Answer.reaction_time_us), pw.fn.MAX(Answer.primary_param)]
+    total_fields = [getattr(SessionSummary, name) for name in SUMMARY_TOTALS] + [SessionSummary.max_primary_param]
+    with SessionSummary._meta.database.atomic():
+        SessionSummary.delete().execute()
+        DailySummary.delete().execute()
+        SessionSummary.insert_from(
+            # started is the time of the first answer, like in update_summaries()
+            Answer.select(Session.uuid, Session.user, Session.exercise, Session.difficulty,
+                          pw.fn.MIN(Session.started + Answer.time_ms / 1000.0), *totals)
+                  .join(Session).group_by(Answer.session),
+            [SessionSummary.session, SessionSummary.user, SessionSummary.exercise,
+             SessionSummary.difficulty, SessionSummary.started, *total_fields]).execute()
+        # the local date of each answer, like datetime.fromtimestamp() in update_summaries()
+        day = pw.fn.DATE(Session.started + Answer.time_ms / 1000.0, 'unixepoch', 'localtime')
+        DailySummary.insert_from(
+            Answer.select(Session.user, Session.exercise, Session.difficulty, day, *totals).join(Session)
+                  .group_by(Session.user, Session.exercise, Session.difficulty, day),
+            [DailySummary.user, DailySummary.exercise, DailySummary.difficulty,
+             DailySummary.day, *[getattr(DailySummary, field.name) for field in total_fields]]).execute()
+
+def migrate_results():
+    """Move the answers of the old 'result' table, one row per answer with the exercise, difficulty
+    and session uuid repeated, into Session and Answer. Drops the old table and compacts the file.
+    Sessions left in the old 'open_session' table stay open and are recovered as orphans."""
+    database = Session._meta.database
+    columns = [column.name for column in database.get_columns('result')]
+
+    def microseconds(name):
+        # older databases lack the latency columns
+        return f'CAST(ROUND(r.{name} * 1e6) AS INTEGER)' if name in columns else 'NULL'
+
+    with database.atomic():
+        database.execute_sql(
+            'INSERT OR IGNORE INTO "session" ("uuid", "user_id", "exercise", "difficulty", "started", "ended") '
+            'SELECT "session", "user_id", "exercise", "difficulty", MIN("time"), MAX("time") FROM "result" GROUP BY "session"')
+        database.execute_sql(
+            'INSERT OR IGNORE INTO "answer" ("session_id", "count", "primary_param", "correctness", "time_ms", '
+            '"time_diff_ms", "reaction_time_us", "system_latency_us") '
+            'SELECT s."id", r."count", r."primary_param", r."correctness", CAST(ROUND((r."time" - s."started") * 1000) AS INTEGER), '
+            f'CAST(ROUND(r."time_diff" * 1000) AS INTEGER), {microseconds("reaction_time")}, {microseconds("system_latency")} '
+            'FROM "result" AS r JOIN "session" AS s ON s."uuid" = r."session"')
+        if database.table_exists('open_session'):
+            database.execute_sql('UPDATE "session" SET "ended" = NULL WHERE "uuid" IN (SELECT "session" FROM "open_session")')
+            database.execute_sql('DROP TABLE "open_session"')
+        database.execute_sql('DROP TABLE "result"')
+    database.execute_sql('VACUUM')
+
+def db_safe_init():
+    """Explicitly open the database, create tables and close. Initalizes missing tables."""
+    tables = [User(), CalibrationData(), Session(), Answer(), SessionSummary(), DailySummary()]
+    db.connect()
+    new_summaries = not SessionSummary.table_exists()
+    db.create_tables(tables)
+    for model in (Session, Answer):
+        add_missing_columns(model)
+    legacy_results = db.table_exists('result')
+    if legacy_results:
+        migrate_results()
+    if new_summaries or legacy_results:
+        backfill_summaries()    # answers stored before the summary tables existed, or migrated
+    db.close()
+
+def add_missing_columns(model):
+    """create_tables() does not alter existing tables. Add nullable columns
+    that were added to the model after the table was created."""
+    existing = [column.name for column in db.get_columns(model._meta.table_name)]
+    migrator = SqliteMigrator(db)
+    operations = [
+        migrator.add_column(model._meta.table_name, field.column_name, field)
+        for field in model._meta.sorted_fields
+        if field.column_name not in existing and field.null
+    ]
+    if operations:
+        migrate(*operations)
+
+schema_lock = Lock()
+schema_ready = False
+
+def ensure_schema():
+    """Runs db_safe_init the first time the database is used. Call it before opening a connection.
+    Threads calling it while the schema is set up wait for it."""
+    global schema_ready
+    with schema_lock:
+        if not schema_ready:
+            db_safe_init()
+            schema_ready = True
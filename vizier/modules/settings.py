@@ -5,19 +5,17 @@ from .profile import db
 from .profile import SESSION
 from .profile_datamodel import CalibrationData
 from .theme import COLORS
-import yaml
+from . import configuration
 
 def save_and_close(s, a, u):
-    """Load configfile, get config data from UI, write to configfile."""
-    with open('./vizier/config/config.yaml') as configfile:
-        config = yaml.safe_load(configfile)
-
-    for key in config['application'].keys():
-        config['application'][key] = dpg.get_value(key)
-
-    with open('./vizier/config/config.yaml', 'w') as configfile:
+    """Get config data from UI, check it and write it to the configfile."""
+    values = {key: dpg.get_value(key) for key in configuration.Application._fields}
+    try:
         helpers.debugger('Writing config to file.')
-        yaml.safe_dump(config, configfile)
+        configuration.save_application(values)
+    except configuration.ConfigError as e:
+        helpers.error(str(e), 'Configuration not saved.')
+        return
 
     #destroy config window
     dpg.delete_item(u)
@@ -25,13 +23,13 @@ def save_and_close(s, a, u):
 
 def list_config_items():
     """Lists configuration options as dpg items."""
-    with open('./vizier/config/config.yaml') as configfile:
-        config = yaml.safe_load(configfile)
-
-    for key, value in config['application'].items():
-        if value == True or value == False:
+    for key, value in configuration.application()._asdict().items():
+        if isinstance(value, bool):
             with dpg.table_row():
                 dpg.add_checkbox(label=key, default_value=value, tag=key)
+        elif isinstance(value, (int, float)):
+            with dpg.table_row():
+                dpg.add_input_float(label=key, default_value=value, tag=key)
         if type(value) == str:
             with dpg.table_row():
                 dpg.add_input_text(label=key, default_value=value, tag=key)
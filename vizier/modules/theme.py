@@ -1,6 +1,5 @@
 import dearpygui.dearpygui as dpg
-from . import helpers
-import yaml
+from . import configuration
 
 COLORS = {
     'red'   : (255,25, 25, 50),
@@ -51,9 +50,14 @@ SAFE_COLORS_TOL = {
     'black'     : (0, 0, 0),
 }
 
+# font name: (path, size)
+FONTS = {
+    'default': ('vizier/assets/fonts/Roboto/Roboto-Regular.ttf', 16),
+    'dyslexic': ('vizier/assets/fonts/OpenDyslexic 3 Beta/OpenDyslexic3-Regular.ttf', 16),
+}
+
 def initialize():
-    with open('./vizier/config/config.yaml') as config_file:
-        config = yaml.safe_load(config_file)
+    config = configuration.application()
 
     # themes, fonts
     with dpg.theme(tag='exercise_theme') as exercise_theme:
@@ -75,26 +79,18 @@ def initialize():
             dpg.add_theme_style(dpg.mvStyleVar_FrameRounding, 2, category=dpg.mvThemeCat_Core)
     dpg.bind_theme(global_theme)
 
-    with dpg.font_registry():
-        font_default = dpg.add_font("vizier/assets/fonts/Roboto/Roboto-Regular.ttf", 16)
-        font_default_hidpi = dpg.add_font("vizier/assets/fonts/Roboto/Roboto-Regular.ttf", 32)
-        font_dyslexic = dpg.add_font("/Users/nme/Tresors/Code/Python/dear_atrac/assets/fonts/OpenDyslexic 3 Beta/OpenDyslexic3-Regular.ttf", 16)
-        font_dyslexic_hidpi = dpg.add_font("/Users/nme/Tresors/Code/Python/dear_atrac/assets/fonts/OpenDyslexic 3 Beta/OpenDyslexic3-Regular.ttf", 16)
-
-    # dpg.bind_font(font_dyslexic)
-
-    if config['application']['hidpi'] == True:
+    # only the font in use is loaded, others are loaded by font() when needed
+    dpg.add_font_registry(tag='fonts')
+    dpg.add_texture_registry(show=False, tag='textures')
+    if config.hidpi:
         dpg.set_global_font_scale(0.5)
-        dpg.bind_font(font_default_hidpi)
-    else:
-        dpg.bind_font(font_default)
-
-    # set image path to walk through
-    image_path = config['application']['image_path']
+    dpg.bind_font(font('default'))
 
-    # add all png images in image_path to texture registry
-    with dpg.texture_registry(show=False, tag='textures'):
-        for imagefile in helpers.dirwalk(image_path):
-            if imagefile.suffix == '.png':
-                width, height, channels, data = dpg.load_image(str(imagefile))
-                dpg.add_static_texture(width, height, data, label=str(imagefile.name), tag=str(imagefile.name))
+def font(name):
+    """Returns a font from FONTS, loading it on first use. Sizes are doubled for hidpi."""
+    if not dpg.does_item_exist(f'font_{name}'):
+        path, size = FONTS[name]
+        if configuration.application().hidpi:
+            size *= 2
+        dpg.add_font(path, size, parent='fonts', tag=f'font_{name}')
+    return f'font_{name}'
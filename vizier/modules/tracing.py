@@ -0,0 +1,148 @@
+"""Module containing tracing for Vizier.
+
+Spans record when a piece of code ran, how long it took and on which thread. Spans
+nest by time per thread. export() writes them as Chrome trace JSON, which Perfetto
+(ui.perfetto.dev) and chrome://tracing open.
+
+Tracing is off until enable() is called. Spans are cheap enough while it is off to
+leave them in: span() returns a shared do-nothing context manager and traced functions
+make one extra call. Use traced_callback() for functions called by dpg and
+traced_chunks() for generators.
+"""
+
+import json
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from time import perf_counter_ns
+
+# spans kept while tracing, older spans are dropped
+MAX_SPANS = 1_000_000
+
+enabled = False
+spans = deque(maxlen=MAX_SPANS)
+NO_SPAN = nullcontext()
+
+def enable(max_spans=MAX_SPANS):
+    """Start recording spans, dropping the ones recorded before."""
+    global enabled, spans
+    spans = deque(maxlen=max_spans)
+    enabled = True
+
+def disable():
+    global enabled
+    enabled = False
+
+@contextmanager
+def _span(name, args):
+    start = perf_counter_ns()
+    try:
+        yield
+    finally:
+        spans.append((name, start, perf_counter_ns() - start, threading.get_ident(), args))
+
+def span(name, **args):
+    """Context manager recording the code it wraps as a span.
+
+    :param name: name of the span.
+    :param args: shown with the span in the trace viewer.
+    """
+    if not enabled:
+        return NO_SPAN
+    return _span(name, args)
+
+def traced(name=None):
+    """Decorator recording every call of a function as a span.
+
+    :param name: name of the span, defaults to the qualified name of the function.
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not enabled:
+                return func(*args, **kwargs)
+            start = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                spans.append((span_name, start, perf_counter_ns() - start, threading.get_ident(), None))
+        return wrapper
+    return decorator
+
+def traced_callback(name=None):
+    """traced() for dpg callbacks. dpg passes a callback as many of sender, app_data and
+    user_data as its signature has positional arguments, which a *args wrapper would hide.
+
+    :param name: name of the span, defaults to the qualified name of the function.
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+        argcount = func.__code__.co_argcount
+
+        @wraps(func)
+        def wrapper(sender=None, app_data=None, user_data=None):
+            args = (sender, app_data, user_data)[:argcount]
+            if not enabled:
+                return func(*args)
+            start = perf_counter_ns()
+            try:
+                return func(*args)
+            finally:
+                spans.append((span_name, start, perf_counter_ns() - start, threading.get_ident(), None))
+        return wrapper
+    return decorator
+
+def traced_chunks(name=None):
+    """traced() for generator functions, like the jobs of the jobs module. Every chunk, from
+    resuming the generator until it yields or returns, is recorded as a span, so the time
+    between chunks is not counted. Only next() is passed on, not send() or throw().
+
+    :param name: name of the spans, defaults to the qualified name of the function.
+    """
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            generator = func(*args, **kwargs)
+            try:
+                while True:
+                    start = perf_counter_ns()
+                    try:
+                        value = next(generator)
+                    except StopIteration as done:
+                        return done.value
+                    finally:
+                        if enabled:
+                            spans.append((span_name, start, perf_counter_ns() - start, threading.get_ident(), None))
+                    yield value
+            finally:
+                generator.close()
+        return wrapper
+    return decorator
+
+def trace_events():
+    """Spans as Chrome trace events: complete events in microseconds, plus thread names."""
+    pid = os.getpid()
+    threads = {thread.ident: thread.name for thread in threading.enumerate()}
+    events = []
+    for name, start_ns, duration_ns, tid, args in list(spans):
+        event = {'name': name, 'ph': 'X', 'ts': start_ns / 1000, 'dur': duration_ns / 1000, 'pid': pid, 'tid': tid}
+        if args:
+            event['args'] = {key: str(value) for key, value in args.items()}
+        events.append(event)
+    for tid in {event['tid'] for event in events}:
+        events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                       'args': {'name': threads.get(tid, str(tid))}})
+    return events
+
+def export(path):
+    """Writes the recorded spans to path as Chrome trace JSON. Returns the number of spans."""
+    events = trace_events()
+    with open(path, 'w') as trace_file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, trace_file)
+    return sum(event['ph'] == 'X' for event in events)